@@ -4,21 +4,33 @@ Orchestrates the end-to-end BOE ingestion pipeline.
 This module is responsible for:
 1. Loading the cache of already processed document IDs.
 2. Iterating over a date range.
-3. Calling the api_client to fetch document IDs for each day.
+3. Calling the api_client to fetch document IDs for each day
+   (revalidating the on-disk summary cache with its ETag).
 4. Filtering out IDs that are already in the cache.
-5. Calling the api_client to fetch XML for new documents.
-6. Calling the parsing_service to extract clean text.
-7. Calling io_helpers to save the new data and update the ID cache.
+5. Calling the api_client to fetch XML for new documents (concurrently).
+6. Calling the parsing_service, in a pool of worker processes, to extract
+   clean text (unless an identical XML payload was already parsed).
+7. Calling io_helpers to save each day's new data and update the ID cache
+   in a single batched write.
+8. Compacting the ID cache into a binary snapshot for fast reloads.
 This version is hardened with a global try/finally block
 to ensure completion is always logged.
 """
+import asyncio
 import httpx
 import logging
+import orjson
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime, timedelta
 
 # --- Imports from our refactored modules ---
 from .services import api_client, parsing_service
+from .services.parse_cache import ParseCache
+from .services.id_index import ProcessedIdIndex
 # Import the 'io_helpers' module to access both save functions
 from utils import io_helpers 
 
@@ -30,35 +42,223 @@ DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "raw_boe"
 OUTPUT_FILE = DATA_DIR / "raw_data.jsonl"
 # This file will store a simple list of IDs (one per line)
 PROCESSED_IDS_FILE = DATA_DIR / "processed_ids.txt"
+# Binary snapshot of the set above, plus the log offset it covers
+PROCESSED_IDS_SNAPSHOT = DATA_DIR / "processed_ids.pkl"
+# Raw XML hash -> parsed text, to skip re-parsing identical payloads
+PARSE_CACHE_FILE = DATA_DIR / "xml_hash.sqlite"
+# Summary JSON + ETag per day, revalidated with If-None-Match on re-runs
+SUMMARY_CACHE_DIR = DATA_DIR / "summary_cache"
+
+# Public (text) URL of a document; the JSONL line template below embeds it
+DOC_URL_PREFIX = b"https://www.boe.es/diario_boe/txt.php?id="
+
+# Maximum number of document XML requests in flight at the same time
+MAX_CONCURRENT_FETCHES = 20
+
+# Worker processes for the CPU-bound XML parsing
+PARSE_WORKERS = os.cpu_count() or 1
+_parse_pool: ProcessPoolExecutor | None = None
+
+# In-process memo of the processed IDs: (log mtime/size, log offset, index).
+# Repeated ingestion runs (backfills) only replay what was appended since.
+_cached_ids: tuple[tuple[int, int], int, ProcessedIdIndex] | None = None
 
 # Ensure the data directory exists before we start
 DATA_DIR.mkdir(parents=True, exist_ok=True)
+SUMMARY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def _read_ids_snapshot() -> tuple[ProcessedIdIndex, int]:
+    """
+    Reads the binary snapshot of the processed IDs cache.
+
+    Returns:
+        The snapshot's index of IDs and the byte offset of the text log it
+        covers. An empty index and offset 0 if there is no usable snapshot.
+    """
+    if not PROCESSED_IDS_SNAPSHOT.exists():
+        return ProcessedIdIndex(), 0
+    try:
+        with open(PROCESSED_IDS_SNAPSHOT, 'rb') as f:
+            offset = pickle.load(f)
+            ids = pickle.load(f)
+        if isinstance(ids, set):
+            # Snapshot written before the compact index was introduced
+            ids = ProcessedIdIndex(ids)
+        return ids, offset
+    except Exception as e:
+        log.warning(f"Ignoring unreadable snapshot {PROCESSED_IDS_SNAPSHOT.name}: {e}")
+        return ProcessedIdIndex(), 0
+
+
+def _replay_ids_log(ids: ProcessedIdIndex, offset: int) -> int:
+    """
+    Adds to 'ids' every ID appended to the text log after 'offset'.
+    A trailing partial line (write in progress) is left for the next replay.
+
+    Returns:
+        The offset up to which the log has been consumed.
+    """
+    with open(PROCESSED_IDS_FILE, 'rb') as f:
+        f.seek(offset)
+        tail = f.read()
+    end = tail.rfind(b'\n') + 1
+    # Strip whitespace/newlines, filtering out any potential empty lines
+    ids.update(line.strip() for line in tail[:end].decode('utf-8').splitlines() if line.strip())
+    return offset + end
 
 
-def load_processed_ids() -> set[str]:
+def _load_ids_and_offset() -> tuple[ProcessedIdIndex, int]:
     """
-    Loads the set of already processed IDs from the cache file
-    for efficient O(1) in-memory lookup.
+    Snapshot + log replay: loads the pickled index and only parses the
+    lines appended to the text log since that snapshot was taken.
+    """
+    ids, offset = _read_ids_snapshot()
+    if offset > PROCESSED_IDS_FILE.stat().st_size:
+        # The log was truncated or replaced: the snapshot is stale
+        log.warning(f"{PROCESSED_IDS_SNAPSHOT.name} is ahead of {PROCESSED_IDS_FILE.name}. Rebuilding from the log.")
+        ids, offset = ProcessedIdIndex(), 0
+    return ids, _replay_ids_log(ids, offset)
+
+
+def _get_ids_and_offset() -> tuple[ProcessedIdIndex, int]:
+    """
+    Memoized _load_ids_and_offset: the index is kept in memory between
+    runs and only reloaded when the log no longer matches it.
+
+    - Same mtime and size: the memo is returned as-is (no read at all).
+    - The log grew: only the appended lines are replayed into the memo.
+    - The log shrank (truncated/replaced): full reload from disk.
+    """
+    global _cached_ids
+    stat = PROCESSED_IDS_FILE.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if _cached_ids is not None:
+        cached_signature, offset, ids = _cached_ids
+        if cached_signature == signature:
+            return ids, offset
+        if offset <= stat.st_size:
+            offset = _replay_ids_log(ids, offset)
+            _cached_ids = (signature, offset, ids)
+            return ids, offset
+
+    ids, offset = _load_ids_and_offset()
+    _cached_ids = (signature, offset, ids)
+    return ids, offset
+
+
+def load_processed_ids() -> ProcessedIdIndex:
+    """
+    Loads the already processed IDs from the cache file into a compact,
+    set-like index for efficient in-memory lookup.
+
+    The append-only text log stays the source of truth; the binary
+    snapshot only saves re-parsing the (potentially huge) log on startup,
+    and the in-process memo saves reloading it on every run.
     
     Returns:
-        A set of document IDs (e.g., {"BOE-A-2023-11073", ...})
+        A ProcessedIdIndex of document IDs (e.g., "BOE-A-2023-11073")
     """
     if not PROCESSED_IDS_FILE.exists():
         log.info(f"{PROCESSED_IDS_FILE.name} not found. Starting from scratch.")
-        return set()
+        return ProcessedIdIndex()
     
     try:
-        with open(PROCESSED_IDS_FILE, 'r', encoding='utf-8') as f:
-            # Read all lines, strip whitespace/newlines, and return as a set
-            # This efficiently filters out any potential empty lines
-            return set(line.strip() for line in f if line.strip())
+        ids, _ = _get_ids_and_offset()
+        return ids
     except IOError as e:
-        log.error(f"Could not read {PROCESSED_IDS_FILE}: {e}. Returning empty set.")
-        # Return an empty set on error to be safe and avoid crashing
-        return set()
+        log.error(f"Could not read {PROCESSED_IDS_FILE}: {e}. Returning empty index.")
+        # Return an empty index on error to be safe and avoid crashing
+        return ProcessedIdIndex()
 
 
-async def ingest_boe_data(start_date_str: str, end_date_str: str):
+def compact_processed_ids():
+    """
+    Rewrites the binary snapshot so it covers the whole text log.
+
+    The snapshot is written to a temporary file and atomically swapped in,
+    so a crash never leaves a half-written snapshot behind.
+    """
+    if not PROCESSED_IDS_FILE.exists():
+        return
+    try:
+        ids, offset = _get_ids_and_offset()
+        tmp_path = PROCESSED_IDS_SNAPSHOT.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            # The offset goes first so it can be read without the whole set
+            pickle.dump(offset, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(ids, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, PROCESSED_IDS_SNAPSHOT)
+        log.info(f"Compacted {len(ids)} processed IDs into {PROCESSED_IDS_SNAPSHOT.name}.")
+    except IOError as e:
+        log.error(f"Could not write snapshot {PROCESSED_IDS_SNAPSHOT}: {e}")
+
+
+def _jsonl_line(doc_id: str, date_bytes: bytes, clean_text: str) -> bytes:
+    """
+    Serializes one output record straight to its JSONL line.
+
+    Byte-for-byte what orjson.dumps would give for the
+    {"id", "date", "url", "texto_limpio"} dict, without building the dict.
+    Only the id and the text need escaping: the date comes from strftime.
+    """
+    id_json = orjson.dumps(doc_id)
+    # id_json[1:] is the escaped id plus its closing quote
+    return (
+        b'{"id":' + id_json
+        + b',"date":"' + date_bytes
+        + b'","url":"' + DOC_URL_PREFIX + id_json[1:]
+        + b',"texto_limpio":' + orjson.dumps(clean_text)
+        + b'}\n'
+    )
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used for XML parsing, creating it on first use.
+
+    Parsing in worker processes runs in parallel across cores and keeps
+    the event loop free to drive the concurrent downloads.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    """
+    Stops the parsing worker processes (called on application shutdown).
+    """
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(cancel_futures=True)
+        _parse_pool = None
+
+
+@asynccontextmanager
+async def _client_scope(client: httpx.AsyncClient | None):
+    """
+    Yields the shared client if one was provided, otherwise opens
+    (and later closes) a private one for the duration of the run.
+    """
+    if client is not None:
+        yield client
+        return
+    async with api_client.create_client() as own_client:
+        yield own_client
+
+
+def _prefetch_summary(client: httpx.AsyncClient, date: datetime) -> asyncio.Task:
+    """
+    Starts fetching the summary IDs of 'date' in the background.
+    """
+    return asyncio.create_task(
+        api_client.fetch_summary_ids(client, date.strftime("%Y%m%d"), cache_dir=SUMMARY_CACHE_DIR)
+    )
+
+
+async def ingest_boe_data(start_date_str: str, end_date_str: str, client: httpx.AsyncClient | None = None):
     """
     Main orchestration function for the ingestion background task.
     
@@ -69,11 +269,13 @@ async def ingest_boe_data(start_date_str: str, end_date_str: str):
     Args:
         start_date_str: Start date in "YYYYMMDD" format.
         end_date_str: End date in "YYYYMMDD" format.
+        client: The application-wide pooled AsyncClient. It is NOT closed
+            here. If omitted, a private client is created for this run.
     """
     log.info(f"--- INGESTION TASK STARTED: {start_date_str} to {end_date_str} ---")
     
     total_new_docs_processed = 0
-    existing_ids = set() # Initialize empty set
+    existing_ids = ProcessedIdIndex() # Initialize empty index
 
     try:
         # --- 1. Load Cache ---
@@ -92,59 +294,103 @@ async def ingest_boe_data(start_date_str: str, end_date_str: str):
         current_date = start_date
 
         # --- 3. Start Main Loop ---
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            while current_date <= end_date:
-                date_str = current_date.strftime("%Y%m%d")
-                log.info(f"Processing date: {date_str}")
+        async with _client_scope(client) as client:
+            # Output files stay open for the whole run (one open/close per task,
+            # not per day); both are flushed once per day's batch. The IDs log
+            # is appended with one O_APPEND write per batch, so concurrent
+            # runs never interleave their lines.
+            with ParseCache(str(PARSE_CACHE_FILE)) as parse_cache, \
+                    open(OUTPUT_FILE, 'ab') as jsonl_fh, \
+                    io_helpers.AppendFd(str(PROCESSED_IDS_FILE)) as ids_fh:
+                # Summaries are prefetched one day ahead, so each RTT is
+                # hidden behind the previous day's document processing
+                next_summary = _prefetch_summary(client, current_date)
+                try:
+                    while current_date <= end_date:
+                        date_str = current_date.strftime("%Y%m%d")
+                        log.info(f"Processing date: {date_str}")
                 
-                # api_client is hardened, won't raise 404/500
-                doc_ids = await api_client.fetch_summary_ids(client, date_str)
+                        # api_client is hardened, won't raise 404/500
+                        doc_ids = await next_summary
+                        if current_date < end_date:
+                            next_summary = _prefetch_summary(client, current_date + timedelta(days=1))
                 
-                if not doc_ids:
-                    log.warning(f"No new documents found for {date_str}. Skipping.")
-                    current_date += timedelta(days=1)
-                    continue
+                        if not doc_ids:
+                            log.warning(f"No new documents found for {date_str}. Skipping.")
+                            current_date += timedelta(days=1)
+                            continue
 
-                log.info(f"Found {len(doc_ids)} document IDs for {date_str}. Checking against cache...")
+                        log.info(f"Found {len(doc_ids)} document IDs for {date_str}. Checking against cache...")
                 
-                new_docs_this_day = 0
-                for doc_id in doc_ids:
-                    
-                    # 4. === THE IDEMPOTENCY CHECK ===
-                    if doc_id in existing_ids:
-                        # Use log.debug for "spammy" messages
-                        log.debug(f"ID {doc_id} already processed. Skipping.")
-                        continue
-                    
-                    # 5. Process the new document
-                    new_docs_this_day += 1
-                    
-                    # api_client is hardened, won't raise 404/500
-                    xml_content = await api_client.fetch_document_xml(client, doc_id)
-                    if not xml_content:
-                        continue 
-
-                    clean_text = parsing_service.parse_legal_text(xml_content)
-                    if not clean_text:
-                        log.warning(f"No text extracted for {doc_id}. Skipping.")
-                        continue
-                    
-                    doc_data = {
-                        "id": doc_id,
-                        "date": date_str,
-                        "url": f"https://www.boe.es/diario_boe/txt.php?id={doc_id}",
-                        "texto_limpio": clean_text
-                    }
-                    
-                    # 6. --- Save to disk (Atomic operation) ---
-                    io_helpers.save_to_jsonl(doc_data, str(OUTPUT_FILE))
-                    io_helpers.save_processed_id(doc_id, str(PROCESSED_IDS_FILE))
-                    existing_ids.add(doc_id)
-                    # --- End of save operation ---
-
-                log.info(f"Date {date_str} completed. Found {new_docs_this_day} new documents.")
-                total_new_docs_processed += new_docs_this_day
-                current_date += timedelta(days=1)
+                        # 4. === THE IDEMPOTENCY CHECK ===
+                        new_ids = [doc_id for doc_id in doc_ids if doc_id not in existing_ids]
+                        log.debug(f"{len(doc_ids) - len(new_ids)} IDs already processed for {date_str}. Skipping them.")
+                        new_docs_this_day = len(new_ids)
+
+                        # 5. Fetch and parse the new documents concurrently.
+                        # The semaphore bounds the number of in-flight requests so we
+                        # overlap network latency without hammering the BOE servers.
+                        semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+                        async def fetch_and_parse(doc_id: str) -> str | None:
+                            async with semaphore:
+                                # api_client is hardened, won't raise 404/500
+                                xml_content = await api_client.fetch_document_xml(client, doc_id)
+                            if not xml_content:
+                                return None # Already logged by api_client
+
+                            # Identical payloads were already parsed: reuse the text
+                            xml_hash = ParseCache.hash_xml(xml_content)
+                            clean_text = parse_cache.get(xml_hash)
+                            if clean_text is None:
+                                clean_text = await asyncio.get_running_loop().run_in_executor(
+                                    _get_parse_pool(), parsing_service.parse_legal_text, xml_content
+                                )
+                                parse_cache.put(xml_hash, clean_text)
+                            return clean_text
+
+                        results = await asyncio.gather(
+                            *(fetch_and_parse(doc_id) for doc_id in new_ids),
+                            return_exceptions=True
+                        )
+
+                        # 6. Collect the day's results in order
+                        date_bytes = date_str.encode()
+                        day_lines = []
+                        day_ids = []
+                        for doc_id, clean_text in zip(new_ids, results):
+                            if isinstance(clean_text, Exception):
+                                log.error(f"Unexpected error processing {doc_id}: {clean_text}")
+                                continue
+                            if clean_text is None:
+                                continue
+
+                            if not clean_text:
+                                log.warning(f"No text extracted for {doc_id}. Skipping.")
+                                continue
+
+                            day_lines.append(_jsonl_line(doc_id, date_bytes, clean_text))
+                            day_ids.append(doc_id)
+
+                        # 7. --- Save to disk (one batched write per day) ---
+                        # Documents go first: a crash in between only means the
+                        # day's documents get downloaded again on the next run.
+                        if io_helpers.write_jsonl_lines(day_lines, jsonl_fh):
+                            io_helpers.write_ids_batch(day_ids, ids_fh)
+                            existing_ids.update(day_ids)
+                        parse_cache.commit()
+                        # --- End of save operation ---
+
+                        log.info(f"Date {date_str} completed. Found {new_docs_this_day} new documents.")
+                        total_new_docs_processed += new_docs_this_day
+                        current_date += timedelta(days=1)
+                finally:
+                    # Never leave a prefetch running past the client's lifetime
+                    next_summary.cancel()
+
+        # --- 8. Refresh the cache snapshot for the next run ---
+        if total_new_docs_processed:
+            compact_processed_ids()
 
     except Exception as e:
         # --- 4. Global Error Catcher ---
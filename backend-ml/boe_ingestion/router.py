@@ -6,8 +6,8 @@ Exposes administrative endpoints, secured by an API Key.
 
 import os
 import logging
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Header, Depends
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Header, Depends, Request
+from pydantic import BaseModel, Field, field_validator
 from .orchestrator import ingest_boe_data
 
 log = logging.getLogger(__name__)
@@ -53,22 +53,29 @@ class IngestRequest(BaseModel):
     """
     start_date: str = Field(
         ...,
-        pattern=r"^\d{8}$",
         description="Start date in YYYYMMDD format",
         json_schema_extra={"example": "20230101"}
     )
     end_date: str = Field(
         ...,
-        pattern=r"^\d{8}$",
         description="End date in YYYYMMDD format",
         json_schema_extra={"example": "20230131"}
     )
 
+    @field_validator("start_date", "end_date")
+    @classmethod
+    def check_yyyymmdd(cls, v: str) -> str:
+        # Plain str checks instead of a regex; isascii() rejects non-ASCII digits
+        if not (len(v) == 8 and v.isascii() and v.isdigit()):
+            raise ValueError("must be YYYYMMDD")
+        return v
+
 
 @router.post("/ingest-boe")
 async def trigger_boe_ingestion(
         request: IngestRequest,
-        background_tasks: BackgroundTasks
+        background_tasks: BackgroundTasks,
+        http_request: Request
 ):
     """
     Triggers a background ingestion task for the BOE.
@@ -79,11 +86,13 @@ async def trigger_boe_ingestion(
     """
     log.info(f"Admin request received: Triggering ingestion from {request.start_date} to {request.end_date}")
 
-    # Add the long-running function as a background task
+    # Add the long-running function as a background task.
+    # It reuses the app-wide pooled HTTP client created at startup.
     background_tasks.add_task(
         ingest_boe_data,
         request.start_date,
-        request.end_date
+        request.end_date,
+        client=http_request.app.state.http_client
     )
 
     # Return an immediate response to the client (BFF)
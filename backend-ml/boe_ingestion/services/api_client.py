@@ -1,10 +1,15 @@
 """
 HTTP Client for interacting with the BOE (Boletín Oficial del Estado) API.
 """
+import asyncio
+import aiohttp
 import httpx
 import logging
-import json
+import ijson
+import os
 from httpx import HTTPStatusError
+from httpx_aiohttp import AiohttpTransport
+from pathlib import Path
 
 log = logging.getLogger(__name__)
 
@@ -12,77 +17,234 @@ log = logging.getLogger(__name__)
 SUMARIO_URL = "https://boe.es/datosabiertos/api/boe/sumario/{date_str}"
 DOC_XML_URL = "https://www.boe.es/diario_boe/xml.php?id={doc_id}"
 
+# --- Connection pool ---
+REQUEST_TIMEOUT = 30.0
+# Sized for the bursty per-day fan-out to the two BOE hosts
+POOL_MAX_CONNECTIONS = 200
+POOL_MAX_CONNECTIONS_PER_HOST = 100
+POOL_KEEPALIVE_SECONDS = 60
 
-async def fetch_summary_ids(client: httpx.AsyncClient, date_str: str) -> list[str]:
+# --- Retry policy (timeouts and 5xx only) ---
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BACKOFF_MIN = 1.0
+RETRY_BACKOFF_MAX = 10.0
+
+# --- Summary streaming ---
+# ijson prefix of each section object: data.sumario.diario[].seccion[]
+SUMMARY_SECCION_PREFIX = "data.sumario.diario.item.seccion.item"
+SUMMARY_CHUNK_SIZE = 64 * 1024
+
+
+def _create_aiohttp_session() -> aiohttp.ClientSession:
     """
-    Fetches all document ID's from the complexly nested BOE summary
+    Builds the aiohttp session backing the httpx transport.
+    Called lazily by the transport on the first request, so the session
+    is always created inside the running event loop.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=POOL_MAX_CONNECTIONS,
+        limit_per_host=POOL_MAX_CONNECTIONS_PER_HOST,
+        keepalive_timeout=POOL_KEEPALIVE_SECONDS
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+def create_client() -> httpx.AsyncClient:
+    """
+    Builds the pooled AsyncClient used for all BOE requests.
+
+    The client is meant to be created once (at application startup) and
+    shared by every ingestion run, so connections are reused instead of
+    being re-established on each run.
+
+    It keeps the httpx API (callers still receive an httpx.AsyncClient)
+    but is backed by an aiohttp transport, which has a much lower
+    per-request overhead when hundreds of GETs are in flight.
+
+    Returns:
+        A configured httpx.AsyncClient. The caller owns it and must close it.
+    """
+    transport = AiohttpTransport(client=_create_aiohttp_session)
+    return httpx.AsyncClient(timeout=REQUEST_TIMEOUT, transport=transport)
+
+
+def _collect_seccion_ids(seccion, date_str: str, all_doc_ids: set[str]):
+    """
+    Adds to 'all_doc_ids' the document IDs of one summary section,
+    if it is section 1 or 3.
 
-    This function navigates the JSON structure:
-    data -> sumario -> diario[] -> seccion[] -> departamento[] -> epigrafe[] -> item[]
+    This function navigates the JSON structure of a section:
+    seccion -> departamento[] -> epigrafe[] -> item[]
 
     It also handles a key inconsistency where 'item' can be a single object or a list of objects
+    """
+    if not isinstance(seccion, dict):
+        log.warning(f"Skipping malformed 'seccion' item (not a dict) on {date_str}")
+        return
+    # --- Sections 1 and 3 filter (nombramientos, oposiciones, anuncios y licitaciones)---
+    codigo_seccion = seccion.get("codigo")
+    if codigo_seccion not in ["1", "3"]:
+        log.debug(f"Skipping section {codigo_seccion} (not legislation)")
+        return
+    # --- End of filter ---
+    for departamento in seccion.get("departamento", []):
+        if not isinstance(departamento, dict):
+            log.warning(f"Skipping malformed 'departamento' item (not a dict) on {date_str}")
+            continue
+
+        for epigrafe in departamento.get("epigrafe", []):
+            if not isinstance(epigrafe, dict):
+                log.warning(f"Skipping malformed 'epigrafe' item (not a dict) on {date_str}")
+                continue
+
+            item_data = epigrafe.get("item")
+            if not item_data:
+                continue
+
+            items_to_process = []
+            if isinstance(item_data, list):
+                items_to_process = item_data
+            elif isinstance(item_data, dict):
+                items_to_process = [item_data]
+
+            for item in items_to_process:
+                if isinstance(item, dict):
+                    doc_id = item.get("identificador")
+                    url_xml = item.get("url_xml")
+
+                    if doc_id and url_xml:
+                        all_doc_ids.add(doc_id)
+
+
+class _SummaryIdParser:
+    """
+    Incremental parser for the summary JSON:
+    data -> sumario -> diario[] -> seccion[] -> ...
+
+    Chunks are fed as they arrive from the network (or the disk cache);
+    ijson yields one complete 'seccion' object at a time, which is walked
+    and dropped. Peak memory is one section, not the whole summary.
+    """
+
+    def __init__(self, date_str: str):
+        self.date_str = date_str
+        # A set deduplicates on the fly (items can be cross-listed in several epigrafes)
+        self.doc_ids: set[str] = set()
+        self._secciones = ijson.sendable_list()
+        self._coro = ijson.items_coro(self._secciones, SUMMARY_SECCION_PREFIX)
+
+    def _drain(self):
+        for seccion in self._secciones:
+            _collect_seccion_ids(seccion, self.date_str, self.doc_ids)
+        del self._secciones[:]
+
+    def feed(self, chunk: bytes):
+        self._coro.send(chunk)
+        self._drain()
+
+    def close(self) -> set[str]:
+        """
+        Finishes parsing (raises ijson.JSONError if truncated) and returns the IDs.
+        Safe to call more than once.
+        """
+        self._coro.close()
+        self._drain()
+        return self.doc_ids
+
+
+async def _send_with_retry(client: httpx.AsyncClient, url: str, headers: dict) -> httpx.Response:
+    """
+    Sends a streamed GET, retrying timeouts and 5xx responses with exponential backoff.
+
+    4xx responses (e.g. the 404 of a Sunday) are returned immediately, they
+    will not change on a retry. After the last attempt the final response is
+    returned (or the timeout re-raised) so the caller handles it as before.
+    The body is not read: the caller must close the returned response.
+    """
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_MIN * 2 ** (attempt - 1))
+        try:
+            response = await client.send(client.build_request("GET", url, headers=headers), stream=True)
+        except httpx.TimeoutException as e:
+            if attempt == RETRY_MAX_ATTEMPTS:
+                raise
+            # The aiohttp transport reports connect failures (refused, DNS)
+            # as ConnectTimeout too: only the cause tells them apart
+            if isinstance(e.__cause__, aiohttp.ClientConnectorError):
+                problem = "Cannot connect to"
+            else:
+                problem = "Timeout on"
+            log.warning(f"{problem} {url} (attempt {attempt}/{RETRY_MAX_ATTEMPTS}): {e}. Retrying in {delay}s")
+        else:
+            if response.status_code < 500 or attempt == RETRY_MAX_ATTEMPTS:
+                return response
+            await response.aclose()
+            log.warning(
+                f"HTTP {response.status_code} on {url} (attempt {attempt}/{RETRY_MAX_ATTEMPTS}). "
+                f"Retrying in {delay}s"
+            )
+        await asyncio.sleep(delay)
+
+
+async def fetch_summary_ids(
+    client: httpx.AsyncClient,
+    date_str: str,
+    cache_dir: Path | None = None
+) -> list[str]:
+    """
+    Fetches all document ID's from the complexly nested BOE summary
+
+    The summary (several MB on heavy days) is never loaded as a whole:
+    it is parsed incrementally with ijson while it downloads.
+
+    Transient failures (timeouts, 5xx) are retried with exponential backoff
+    instead of silently dropping the whole day.
+
+    If cache_dir is given, the summary is stored there as {date}.json together
+    with its ETag ({date}.etag). Later runs send If-None-Match and, on a
+    304 Not Modified, re-use the copy on disk instead of downloading it again.
 
     Args:
         client: An httpx.AsyncClient instance
         date_str: the date in "YYYYMMDD" format
+        cache_dir: Optional directory for the conditional-GET summary cache
 
     Returns:
-        A flat list of all documents IDs (e.g, "BOE-A-2023-11073")
+        A flat list of all unique documents IDs (e.g, "BOE-A-2023-11073")
         found in the summary
     """
-    all_doc_ids = []
+    headers = {"Accept": "application/json"}
+    cache_file = etag_file = None
+    if cache_dir is not None:
+        cache_file = cache_dir / f"{date_str}.json"
+        etag_file = cache_dir / f"{date_str}.etag"
+        # Only revalidate when both halves of the cache entry are present
+        if cache_file.exists() and etag_file.exists():
+            headers["If-None-Match"] = etag_file.read_text(encoding="utf-8").strip()
+
+    parser = _SummaryIdParser(date_str)
     try:
         url = SUMARIO_URL.format(date_str=date_str)
-        response = await client.get(url, headers={"Accept": "application/json"})
-        
-        # This will raise HTTPStatusError for 4xx or 5xx responses
-        response.raise_for_status() 
-        
-        data = response.json().get("data", {})
-        diario_list = data.get("sumario", {}).get("diario", [])
-        
-        for diario in diario_list:
-            if not isinstance(diario, dict):
-                log.warning(f"Skipping malformed 'diario' item (not a dict) on {date_str}")
-                continue
+        response = await _send_with_retry(client, url, headers)
+        try:
+            if response.status_code == 304 and cache_file is not None:
+                log.debug(f"Summary for {date_str} not modified, using cached copy")
+                with open(cache_file, 'rb') as f:
+                    while chunk := f.read(SUMMARY_CHUNK_SIZE):
+                        parser.feed(chunk)
+            else:
+                # This will raise HTTPStatusError for 4xx or 5xx responses
+                response.raise_for_status()
+                etag = response.headers.get("ETag")
+                if cache_file is not None and etag:
+                    await _stream_and_cache(response, parser, cache_file, etag_file, etag)
+                else:
+                    async for chunk in response.aiter_bytes():
+                        parser.feed(chunk)
+        finally:
+            await response.aclose()
 
-            for seccion in diario.get("seccion", []):
-                if not isinstance(seccion, dict):
-                    log.warning(f"Skipping malformed 'seccion' item (not a dict) on {date_str}")
-                    continue
-                # --- Sections 1 and 3 filter (nombramientos, oposiciones, anuncios y licitaciones)---
-                codigo_seccion = seccion.get("codigo")
-                if codigo_seccion not in ["1", "3"]:
-                    log.debug(f"Skipping section {codigo_seccion} (not legislation)")
-                    continue
-                # --- End of filter ---
-                for departamento in seccion.get("departamento", []):
-                    if not isinstance(departamento, dict):
-                        log.warning(f"Skipping malformed 'departamento' item (not a dict) on {date_str}")
-                        continue
-
-                    for epigrafe in departamento.get("epigrafe", []):
-                        if not isinstance(epigrafe, dict):
-                            log.warning(f"Skipping malformed 'epigrafe' item (not a dict) on {date_str}")
-                            continue
-
-                        item_data = epigrafe.get("item")
-                        if not item_data:
-                            continue
-                            
-                        items_to_process = []
-                        if isinstance(item_data, list):
-                            items_to_process = item_data
-                        elif isinstance(item_data, dict):
-                            items_to_process = [item_data]
-                        
-                        for item in items_to_process:
-                            if isinstance(item, dict):
-                                doc_id = item.get("identificador")
-                                url_xml = item.get("url_xml")
-                                
-                                if doc_id and url_xml:
-                                    all_doc_ids.append(doc_id)
+        all_doc_ids = parser.close()
 
     except HTTPStatusError as e:
         if e.response.status_code == 404:
@@ -96,17 +258,69 @@ async def fetch_summary_ids(client: httpx.AsyncClient, date_str: str) -> list[st
     except httpx.RequestError as e:
         log.error(f"Network error fetching summary for {date_str}: {e}")
         return []
-    except json.JSONDecodeError as e:
+    except ijson.JSONError as e:
         log.error(f"JSON decode error for summary {date_str}: {e}")
         return []
-        
-    return list(set(all_doc_ids))
+    except OSError as e:
+        log.error(f"Could not read cached summary for {date_str}: {e}")
+        return []
+
+    return list(all_doc_ids)
+
+
+async def _stream_and_cache(
+    response: httpx.Response,
+    parser: _SummaryIdParser,
+    cache_file: Path,
+    etag_file: Path,
+    etag: str
+):
+    """
+    Feeds the summary to the parser while copying it to the disk cache.
+
+    The body goes to a temporary file that is swapped in once complete,
+    and the ETag is written last: a crash or a cache error only costs
+    a full GET next time.
+    """
+    tmp_file = cache_file.with_suffix(".tmp")
+    f = None
+    try:
+        f = open(tmp_file, 'wb')
+    except OSError as e:
+        log.warning(f"Could not cache summary {cache_file.name}: {e}")
+    try:
+        async for chunk in response.aiter_bytes():
+            parser.feed(chunk)
+            if f is not None:
+                try:
+                    f.write(chunk)
+                except OSError as e:
+                    log.warning(f"Could not cache summary {cache_file.name}: {e}")
+                    f.close()
+                    f = None
+    finally:
+        if f is not None:
+            f.close()
+    if f is None:
+        return
+
+    # Never cache a truncated body: this raises ijson.JSONError if incomplete
+    parser.close()
+    try:
+        os.replace(tmp_file, cache_file)
+        etag_file.write_text(etag, encoding="utf-8")
+    except OSError as e:
+        log.warning(f"Could not cache summary {cache_file.name}: {e}")
 
 
-async def fetch_document_xml(client: httpx.AsyncClient, doc_id: str) -> str | None:
+async def fetch_document_xml(client: httpx.AsyncClient, doc_id: str) -> bytes | None:
     """
     Fetches the full XML content for a specific document ID.
     Hardened to handle 404s gracefully.
+
+    The raw response bytes are returned as-is (no str decode): the
+    parsing_service streams them straight into lxml, which honours
+    the encoding declared in the XML itself.
     """
     try:
         url = DOC_XML_URL.format(doc_id=doc_id)
@@ -117,7 +331,7 @@ async def fetch_document_xml(client: httpx.AsyncClient, doc_id: str) -> str | No
             return None
 
         response.raise_for_status()
-        return response.text
+        return response.content
         
     except HTTPStatusError as e:
         log.error(f"HTTP error fetching XML for {doc_id}: {e}")
@@ -0,0 +1,81 @@
+"""
+Compact in-memory index of already processed BOE document IDs.
+"""
+import logging
+import re
+from typing import Iterable
+
+try:
+    from pyroaring import BitMap
+except ImportError:  # Optional: fall back to a plain set of ints
+    BitMap = None
+
+log = logging.getLogger(__name__)
+
+# "BOE-A-2023-11073" -> series letter, year, zero-padded number
+_BOE_ID_REGEX = re.compile(r"BOE-([A-Z])-(\d{4})-(\d{5,7})")
+
+# Bit layout of a packed ID: letter (5 bits) | year - 1960 (7 bits) | number (20 bits)
+_YEAR_BASE = 1960
+_YEAR_BITS = 7
+_NUMBER_BITS = 20
+
+
+def _pack(doc_id: str) -> int | None:
+    """
+    Packs a canonical BOE ID into a 32-bit int, or returns None if the
+    ID doesn't fit the layout (it is then kept as a string instead).
+
+    Only the canonical zero-padded form is packed, so two different
+    strings never map to the same int.
+    """
+    match = _BOE_ID_REGEX.fullmatch(doc_id)
+    if match is None:
+        return None
+    letter, year_str, number_str = match.groups()
+    year = int(year_str) - _YEAR_BASE
+    number = int(number_str)
+    if not (0 <= year < 1 << _YEAR_BITS and number < 1 << _NUMBER_BITS):
+        return None
+    if number_str != f"{number:05d}":
+        return None
+    return (((ord(letter) - ord("A")) << _YEAR_BITS | year) << _NUMBER_BITS) | number
+
+
+class ProcessedIdIndex:
+    """
+    Set-like container (in, add, update, len) for processed document IDs.
+
+    A set[str] costs ~100-200 bytes per ID, which adds up to hundreds of MB
+    once the cache reaches millions of documents. Here every well-formed
+    BOE ID is packed into a 32-bit int and stored in a roaring bitmap
+    (pyroaring, ~1-2 bytes per ID) or, if it isn't installed, in a set of
+    ints. Lookups stay exact: there are no false positives, unlike a
+    Bloom filter. The rare ID that doesn't fit the layout goes to a
+    regular set of strings.
+    """
+
+    def __init__(self, doc_ids: Iterable[str] = ()):
+        self._packed = BitMap() if BitMap is not None else set()
+        self._other: set[str] = set()
+        self.update(doc_ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        packed = _pack(doc_id)
+        if packed is None:
+            return doc_id in self._other
+        return packed in self._packed
+
+    def __len__(self) -> int:
+        return len(self._packed) + len(self._other)
+
+    def add(self, doc_id: str):
+        packed = _pack(doc_id)
+        if packed is None:
+            self._other.add(doc_id)
+        else:
+            self._packed.add(packed)
+
+    def update(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            self.add(doc_id)
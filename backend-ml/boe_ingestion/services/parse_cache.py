@@ -0,0 +1,66 @@
+"""
+On-disk cache of parsed BOE documents, keyed by a hash of the raw XML.
+"""
+import hashlib
+import logging
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+
+class ParseCache:
+    """
+    Maps the hash of a raw XML payload to the clean text extracted from it.
+
+    Parsing is the main CPU cost of the ingestion, and byte-identical
+    payloads do come back (republished documents, re-runs after a crash
+    between the document and ID writes). A cache hit skips
+    parse_legal_text entirely.
+
+    Backed by a single SQLite table so lookups stay O(log N) without
+    loading the cache in memory. Cache failures are logged and treated
+    as misses: they never abort an ingestion.
+    """
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS parsed_xml (hash BLOB PRIMARY KEY, text TEXT NOT NULL)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def hash_xml(xml_content: bytes) -> bytes:
+        """Returns a 128-bit blake2b digest of the raw payload."""
+        return hashlib.blake2b(xml_content, digest_size=16).digest()
+
+    def get(self, key: bytes) -> str | None:
+        """Returns the cached clean text, or None on a miss."""
+        try:
+            row = self.conn.execute("SELECT text FROM parsed_xml WHERE hash = ?", (key,)).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            log.error(f"Parse cache lookup failed: {e}")
+            return None
+
+    def put(self, key: bytes, text: str):
+        """Stores the clean text (committed on the next commit())."""
+        try:
+            self.conn.execute("INSERT OR IGNORE INTO parsed_xml (hash, text) VALUES (?, ?)", (key, text))
+        except sqlite3.Error as e:
+            log.error(f"Parse cache insert failed: {e}")
+
+    def commit(self):
+        try:
+            self.conn.commit()
+        except sqlite3.Error as e:
+            log.error(f"Parse cache commit failed: {e}")
+
+    def close(self):
+        self.commit()
+        self.conn.close()
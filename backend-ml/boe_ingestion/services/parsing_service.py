@@ -2,51 +2,112 @@
 Service for parsing BOE XML content into clean text.
 """
 import logging
-from bs4 import BeautifulSoup
+from io import BytesIO
+from lxml import etree
 
 log = logging.getLogger(__name__)
 
-def parse_legal_text(xml_content: str) -> str:
+# Depth of the main <texto> element: /documento/texto
+_MAIN_TEXTO_DEPTH = 2
+
+# Parser options shared by every call. iterparse builds its own parser per
+# document (an XMLParser instance cannot be passed to it), so these settings
+# are what we can reuse:
+# - huge_tree: don't abort on very long consolidated texts
+# - recover: salvage what we can from a malformed payload instead of dropping it
+# - remove_blank_text: skip whitespace-only nodes between elements
+# - resolve_entities: never expand external/DTD entities from remote input
+_ITERPARSE_OPTIONS = {
+    "huge_tree": True,
+    "recover": True,
+    "remove_blank_text": True,
+    "resolve_entities": False,
+}
+
+
+def _discard_processed(elem) -> None:
+    """
+    Frees an element we are done with, together with its already
+    processed previous siblings, so the in-memory tree never grows
+    beyond the element currently being parsed.
+    """
+    elem.clear(keep_tail=True)
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+
+def parse_legal_text(xml_content: str | bytes) -> str:
     """
     Parses the raw BOE XML content to extract clean, structured legal text.
 
     It targets the main <texto> tag that is a *direct child* of <documento>
     to avoid capturing cross-reference text from the <analisis> block.
+
+    The document is parsed incrementally with lxml's iterparse: branches
+    we don't need (<metadatos>, <analisis>...) are discarded as soon as
+    they are closed, each <p> is freed once its text has been extracted,
+    and parsing stops at the end of the main <texto>. Peak memory is
+    therefore bounded by one top-level block instead of the whole document.
     
     Args:
-        xml_content: The raw XML string from the BOE API.
+        xml_content: The raw XML (preferably bytes) from the BOE API.
 
     Returns:
         The clean, newline-separated text, or an empty string if
         parsing fails or the main <texto> tag is not found.
     """
     try:
-        # Use 'lxml-xml' parser, as it's faster and designed for XML
-        soup = BeautifulSoup(xml_content, 'lxml-xml')
-        
-        # --- ESTA ES LA LÍNEA MÁS IMPORTANTE DEL ARCHIVO ---
-        # Usamos 'documento > texto' para seleccionar solo la etiqueta <texto>
-        # principal, ignorando las que están anidadas en <analisis>.
-        text_element = soup.select_one('documento > texto')
+        # Bytes let lxml honour the encoding declared by the document itself
+        xml_bytes = xml_content.encode("utf-8") if isinstance(xml_content, str) else xml_content
+
+        # Cheap pre-check: documents without any <texto> (summary records,
+        # redirects, empty payloads) can't yield text, so skip the parse
+        if b"<texto" not in xml_bytes:
+            log.warning("No main <texto> tag found (expected at '/documento/texto').")
+            return ""
+
+        text_element = None
+        text_lines = []
+        depth = 0
+
+        for event, elem in etree.iterparse(
+            BytesIO(xml_bytes), events=("start", "end"), **_ITERPARSE_OPTIONS
+        ):
+            if event == "start":
+                depth += 1
+                if text_element is None and depth == _MAIN_TEXTO_DEPTH and elem.tag == "texto":
+                    text_element = elem
+                continue
+
+            depth -= 1
+            if text_element is None:
+                # Drop every finished top-level block that precedes <texto>
+                if depth == _MAIN_TEXTO_DEPTH - 1:
+                    _discard_processed(elem)
+                continue
+
+            if elem is text_element:
+                # We have everything we need, ignore the rest of the document
+                break
+
+            if elem.tag == "p":
+                # Extract the text from each <p> tag, stripping leading/trailing whitespace
+                text_lines.append("".join(elem.itertext()).strip())
+                _discard_processed(elem)
         
-        if not text_element:
+        if text_element is None:
             # If the main <texto> tag is missing, this doc is unusable.
-            log.warning("No main <texto> tag found (using 'documento > texto' selector).")
+            log.warning("No main <texto> tag found (expected at '/documento/texto').")
             return ""
 
-        # Find all <p> tags within the main text element.
-        all_paragraphs = text_element.find_all('p')
-        
-        if not all_paragraphs:
+        if not text_lines:
             # This fallback is now much less likely to be called.
             log.warning("<texto> tag was found but contained no <p> tags. Using fallback.")
-            fallback_text = " ".join(text_element.get_text(strip=True).split())
+            fallback_text = " ".join("".join(text_element.itertext()).split())
             return fallback_text.replace("\xa0", " ")
 
-        # Extract the text from each <p> tag, stripping leading/trailing whitespace
-        text_lines = [p.get_text(strip=True) for p in all_paragraphs]
-        
         # Filter out any lines that became empty after stripping
+        # (remove_blank_text doesn't touch the text *inside* an empty <p>)
         non_empty_lines = [line for line in text_lines if line]
         
         # Join all lines with a newline. This preserves the document's
@@ -59,4 +120,4 @@ def parse_legal_text(xml_content: str) -> str:
 
     except Exception as e:
         log.error(f"An unexpected error occurred during XML parsing: {e}")
-        return ""
\ No newline at end of file
+        return ""
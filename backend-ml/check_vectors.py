@@ -33,8 +33,9 @@ def verify_embeddings():
         file_path = os.path.join(OUTPUTS_DIR, filename)
         
         try:
-            # Load the numpy array from disk
-            data = np.load(file_path)
+            # mmap_mode='r': only the small header is parsed, and the
+            # (potentially multi-GB) vectors are never read from disk
+            data = np.load(file_path, mmap_mode='r')
             
             # 4. Dimension Check
             # The shape is typically (batch_size, vector_dimension).
@@ -2,15 +2,24 @@
 Script for semantic chunking of raw BOE data.
 
 Reads 'raw_data.jsonl' and splits each document's text based on
-legal boundaries (Artículos, Disposiciones, etc.) into a new
-'knowledge_chunks.jsonl' file, ready for embedding.
+legal boundaries (Artículos, Disposiciones, etc.) into
+'knowledge_chunks.jsonl', ready for embedding. Documents chunked by a
+previous run are skipped.
+
+Run from backend-ml/ as a module: python -m data_processing.chunker
 """
 
-import json
 import logging
+import orjson
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+
+from utils.io_helpers import iter_lines_mmap
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,16 +30,81 @@ log = logging.getLogger(__name__)
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 RAW_DATA_FILE = DATA_DIR / "raw_boe" / "raw_data.jsonl"
 OUTPUT_FILE = DATA_DIR / "knowledge_chunks.jsonl"
-PROCESSED_IDS_FILE = DATA_DIR / "raw_boe" / "processed_ids.txt" # We will reuse this
+# IDs of the raw documents already chunked into OUTPUT_FILE (one per line).
+# Each batch ends with an "@<offset>" line: the size of OUTPUT_FILE once
+# the batch's chunks were synced to disk.
+# Not the ingestion's processed_ids.txt: that one lists *downloaded* documents.
+CHUNKED_IDS_FILE = DATA_DIR / "chunked_ids.txt"
+
+# Parallel chunking: worker processes and raw_data.jsonl lines per task
+CHUNKING_WORKERS = os.cpu_count() or 1
+CHUNKING_BATCH_LINES = 100
+
+# Chunk titles: the first line is used only if shorter than this
+TITLE_MAX_LEN = 150
+
+# The ingestion writes "id" first on each raw line: enough to skip
+# already chunked documents without parsing the JSON
+_LINE_ID_REGEX = re.compile(rb'^\{"id":\s*"([^"\\]*)"')
 
 # --- The Semantic Chunking Regex ---
-# This Regex is designed to split the text *before* major legal sections.
-# It uses a "positive lookahead" (?=...) to split without consuming the delimiter.
-LEGAL_BOUNDARY_REGEX = re.compile(
-    r"\n\s*(?=Artículo \d+\.|Disposición \w+|Anexo|CAPÍTULO [IVXLCDM]+\.|TÍTULO [IVXLCDM]+\.)",
-    re.IGNORECASE
+# RE2 (DFA, linear time) is used when the optional google-re2 package is
+# installed; it scans large documents several times faster than Python's re.
+try:
+    import re2 as _regex_engine
+    # RE2's \w is ASCII-only: spell out Unicode word chars ("Disposición única")
+    _WORD = r"[\pL\pN_]"
+except ImportError:
+    _regex_engine = re
+    _WORD = r"\w"
+
+# This Regex matches the line break *before* major legal sections; group 1
+# is the start of the section. There is no lookahead (RE2 doesn't support
+# it): process_document slices the text at each group 1 start instead.
+LEGAL_BOUNDARY_REGEX = _regex_engine.compile(
+    r"(?i)\n\s*(Artículo \d+\.|Disposición " + _WORD + r"+|Anexo|CAPÍTULO [IVXLCDM]+\.|TÍTULO [IVXLCDM]+\.)"
 )
 
+
+def _split_at_boundaries(text: str) -> List[str]:
+    """
+    Splits the text before each legal boundary, keeping the delimiter
+    (e.g., "Artículo 1.") at the beginning of each chunk.
+    Equivalent to a split on a lookahead pattern.
+    """
+    pieces = []
+    prev = 0
+    for match in LEGAL_BOUNDARY_REGEX.finditer(text):
+        pieces.append(text[prev:match.start()])
+        prev = match.start(1)
+    pieces.append(text[prev:])
+    return pieces
+
+def _is_upper(line: str) -> bool:
+    """
+    Same result as line.isupper(). ASCII lines (most BOE titles) take the
+    bytes path, a table lookup per byte instead of a Unicode category check
+    per code point.
+    """
+    if line.isascii():
+        return line.encode('ascii').isupper()
+    return line.isupper()
+
+def _chunk_title(chunk_text: str) -> str:
+    """
+    A simple heuristic: if the first line is short and looks like a title
+    (all caps), use it. Otherwise the chunk is titled "Context".
+    """
+    # Only the first TITLE_MAX_LEN chars are searched for the line break:
+    # a longer first line can't be a title anyway
+    end = chunk_text.find('\n', 0, TITLE_MAX_LEN)
+    if end == -1:
+        if len(chunk_text) >= TITLE_MAX_LEN:
+            return "Context"
+        end = len(chunk_text)
+    first_line = chunk_text[:end]
+    return first_line if _is_upper(first_line) else "Context"
+
 def process_document(data: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Takes a single document (as a dict) and splits it into semantic chunks.
@@ -54,7 +128,7 @@ def process_document(data: Dict[str, Any]) -> List[Dict[str, Any]]:
 
     # Split the text using our regex. This keeps the delimiter (e.g., "Artículo 1.")
     # at the beginning of each chunk, which is exactly what we want.
-    chunks = LEGAL_BOUNDARY_REGEX.split(text)
+    chunks = _split_at_boundaries(text)
 
     chunk_seq = 0
     for chunk_text in chunks:
@@ -63,12 +137,7 @@ def process_document(data: Dict[str, Any]) -> List[Dict[str, Any]]:
             continue
             
         # Try to extract a title (the first line)
-        first_line = chunk_text.split('\n', 1)[0]
-        # A simple heuristic: if the first line is short and looks like a title, use it.
-        if len(first_line) < 150 and first_line.isupper():
-            chunk_title = first_line
-        else:
-            chunk_title = "Context"
+        chunk_title = _chunk_title(chunk_text)
 
         chunk_id = f"{doc_id}_chunk_{chunk_seq}"
         chunk_data = {
@@ -83,10 +152,122 @@ def process_document(data: Dict[str, Any]) -> List[Dict[str, Any]]:
         
     return chunks_data
 
+def process_batch(lines: List[bytes]) -> Tuple[List[bytes], int, List[str]]:
+    """
+    Chunks a batch of raw_data.jsonl lines (run in a worker process).
+
+    Args:
+        lines: Raw JSONL lines, one document each.
+
+    Returns:
+        The encoded output lines for all the batch's chunks, in order,
+        the number of documents that produced at least one chunk, and
+        the IDs of all the documents handled (to mark them as chunked).
+    """
+    encoded_chunks = []
+    docs_with_chunks = 0
+    doc_ids = []
+    for line in lines:
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            log.warning(f"Skipping malformed JSON line: {line[:50].decode('utf-8', 'replace')}...")
+            continue
+
+        if data.get("id"):
+            doc_ids.append(data["id"])
+
+        # Call our pure, testable function
+        chunks = process_document(data)
+
+        if chunks:
+            docs_with_chunks += 1
+            # orjson emits UTF-8 bytes directly (same as ensure_ascii=False)
+            encoded_chunks.extend(orjson.dumps(chunk_data) + b'\n' for chunk_data in chunks)
+
+    return encoded_chunks, docs_with_chunks, doc_ids
+
+
+def _load_chunked_ids() -> set:
+    """
+    Loads the IDs (as bytes, to match raw lines) of the documents already
+    chunked into OUTPUT_FILE.
+
+    Only batches closed by an "@<offset>" line count: both files are
+    truncated to the last closed batch, dropping the chunks of a batch
+    interrupted before its IDs were logged (they are re-chunked, not
+    duplicated). Without a usable log, the output can't be trusted and
+    is deleted.
+    """
+    if CHUNKED_IDS_FILE.exists() and OUTPUT_FILE.exists():
+        with open(CHUNKED_IDS_FILE, 'rb') as f:
+            log_bytes = f.read()
+        ids, batch_ids, offset, log_end, position = set(), [], 0, 0, 0
+        # The last piece is empty, or a line cut short by a crash
+        for line in log_bytes.split(b'\n')[:-1]:
+            position += len(line) + 1
+            if line.startswith(b'@'):
+                ids.update(batch_ids)
+                batch_ids, offset, log_end = [], int(line[1:]), position
+            elif line:
+                batch_ids.append(line)
+        if offset <= OUTPUT_FILE.stat().st_size:
+            with open(OUTPUT_FILE, 'r+b') as f:
+                f.truncate(offset)
+            with open(CHUNKED_IDS_FILE, 'r+b') as f:
+                f.truncate(log_end)
+            return ids
+        log.warning(f"{OUTPUT_FILE} is shorter than {CHUNKED_IDS_FILE} records.")
+
+    # Delete the old output file to start fresh
+    if OUTPUT_FILE.exists():
+        log.warning(f"Deleting existing output file: {OUTPUT_FILE}")
+        OUTPUT_FILE.unlink()
+    CHUNKED_IDS_FILE.unlink(missing_ok=True)
+    return set()
+
+
+def _is_new(line: bytes, seen_ids: set) -> bool:
+    """
+    Cheap pre-parse check on a raw line, without decoding the JSON.
+    Lines without text (they would yield no chunks) are left out, and so
+    are documents already chunked: by a previous run, or earlier in this
+    one (duplicated lines in raw_data.jsonl). New IDs are added to seen_ids.
+    """
+    if b'"texto_limpio"' not in line:
+        return False
+    match = _LINE_ID_REGEX.match(line)
+    if match is None:
+        # Unexpected layout: let process_batch parse it
+        return True
+    doc_id = match.group(1)
+    if doc_id in seen_ids:
+        return False
+    seen_ids.add(doc_id)
+    return True
+
+
+def _read_batches(lines: Iterable[bytes], batch_size: int, seen_ids: set) -> Iterator[List[bytes]]:
+    """
+    Groups raw lines in lists of batch_size lines,
+    leaving out the lines that wouldn't produce new chunks (see _is_new).
+    """
+    new_lines = (line for line in lines if _is_new(line, seen_ids))
+    while batch := list(islice(new_lines, batch_size)):
+        yield batch
+
+
 def run_chunking_pipeline():
     """
     Main function to run the full chunking pipeline:
     Reads raw data, processes each doc, and writes chunks to output.
+
+    Documents are independent, so batches of lines are chunked in parallel
+    by a pool of worker processes. Results are written back in input
+    order, and only a bounded number of batches is in flight at a time.
+
+    The run is incremental: documents listed in CHUNKED_IDS_FILE are
+    skipped and new chunks are appended to the existing output.
     """
     log.info(f"Starting semantic chunking...")
     log.info(f"Input file: {RAW_DATA_FILE}")
@@ -96,40 +277,48 @@ def run_chunking_pipeline():
         log.error(f"Input file not found: {RAW_DATA_FILE}. Aborting.")
         return
 
-    # Delete the old output file to start fresh
-    if OUTPUT_FILE.exists():
-        log.warning(f"Deleting existing output file: {OUTPUT_FILE}")
-        OUTPUT_FILE.unlink()
+    # Grows with every document sent to the workers (deduplicates the run)
+    seen_ids = _load_chunked_ids()
+    log.info(f"Found {len(seen_ids)} already chunked documents. Skipping them.")
 
     total_chunks = 0
     total_docs = 0
 
+    def write_result(future):
+        nonlocal total_chunks, total_docs
+        encoded_chunks, docs_with_chunks, doc_ids = future.result()
+        output_f.writelines(encoded_chunks)
+        output_f.flush()
+        # The chunks must be on disk before the log points past them: after
+        # a crash, the next run truncates the output to the last logged
+        # offset, so an unlogged batch is re-chunked rather than duplicated
+        os.fsync(output_f.fileno())
+        ids_f.writelines(doc_id + '\n' for doc_id in doc_ids)
+        ids_f.write(f"@{output_f.tell()}\n")
+        ids_f.flush()
+        total_chunks += len(encoded_chunks)
+        total_docs += docs_with_chunks
+
     try:
-        with open(RAW_DATA_FILE, 'r', encoding='utf-8') as input_f:
-            with open(OUTPUT_FILE, 'a', encoding='utf-8') as output_f:
-                
-                for line in input_f:
-                    try:
-                        data = json.loads(line)
-                    except json.JSONDecodeError:
-                        log.warning(f"Skipping malformed JSON line: {line[:50]}...")
-                        continue
-
-                    # Call our pure, testable function
-                    chunks = process_document(data)
-                    
-                    if chunks:
-                        total_docs += 1
-                        for chunk_data in chunks:
-                            output_f.write(json.dumps(chunk_data, ensure_ascii=False) + '\n')
-                            total_chunks += 1
+        with open(OUTPUT_FILE, 'ab') as output_f, \
+                open(CHUNKED_IDS_FILE, 'a', encoding='utf-8') as ids_f, \
+                ProcessPoolExecutor(max_workers=CHUNKING_WORKERS) as pool:
+            pending = deque()
+            raw_lines = iter_lines_mmap(str(RAW_DATA_FILE))
+            for batch in _read_batches(raw_lines, CHUNKING_BATCH_LINES, seen_ids):
+                pending.append(pool.submit(process_batch, batch))
+                # Backpressure: don't read the whole input ahead of the workers
+                if len(pending) >= CHUNKING_WORKERS * 2:
+                    write_result(pending.popleft())
+            while pending:
+                write_result(pending.popleft())
 
     except IOError as e:
         log.error(f"Error reading/writing file: {e}")
     except Exception as e:
         log.error(f"An unexpected error occurred: {e}")
 
-    log.info(f"Chunking complete. Processed {total_docs} documents.")
+    log.info(f"Chunking complete. Processed {total_docs} new documents.")
     log.info(f"Created {total_chunks} semantic chunks in {OUTPUT_FILE}.")
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+"""
+One-shot script that expands the "monster chunks" into their sub-chunks.
+
+Monster chunks (too long for the embedding model) were re-split in the Colab
+pipeline with a RecursiveCharacterTextSplitter, and each piece was embedded
+under the ID "{doc_id}_monster_sub_{i}". This script reproduces that split
+once and persists it to 'monster_sub_chunks.jsonl' ({"sub_id", "text"} per
+line), so the vector loader can read the sub-chunks directly instead of
+re-running the splitter (and importing LangChain) on every load.
+
+Run from backend-ml/ as a module: python -m data_processing.expand_monster_chunks
+"""
+
+import logging
+import os
+from typing import Iterator, Tuple
+
+import orjson
+
+from utils.io_helpers import JsonlWriter, iter_lines_with_progress
+
+# --- Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+log = logging.getLogger(__name__)
+
+# Paths
+# Resolves to backend-ml/data/outputs/
+OUTPUTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'outputs')
+MONSTER_FILE = os.path.join(OUTPUTS_DIR, 'monster_chunks_to_fix.jsonl')
+MONSTER_SUB_CHUNKS_FILE = os.path.join(OUTPUTS_DIR, 'monster_sub_chunks.jsonl')
+
+# Splitter settings used in Colab. Must not change, or the sub-chunk IDs
+# would no longer match the embedded vectors.
+SUB_CHUNK_SIZE = 2000
+SUB_CHUNK_OVERLAP = 200
+SUB_CHUNK_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+
+def iter_monster_sub_chunks(monster_file: str) -> Iterator[Tuple[str, str]]:
+    """
+    Re-splits every monster chunk exactly as the Colab pipeline did.
+
+    Args:
+        monster_file: Path to 'monster_chunks_to_fix.jsonl'.
+
+    Yields:
+        (sub_id, sub_text) pairs, e.g. ("BOE-A-2023-11073_monster_sub_0", "...").
+    """
+    # Imported here: only needed when the expanded file has to be (re)built
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=SUB_CHUNK_SIZE,
+        chunk_overlap=SUB_CHUNK_OVERLAP,
+        separators=SUB_CHUNK_SEPARATORS
+    )
+
+    for line in iter_lines_with_progress(monster_file, "Splitting monster chunks"):
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue
+        original_text = data.get('text', '')
+        doc_id = data.get('doc_id', 'unknown')
+
+        for i, sub_text in enumerate(text_splitter.split_text(original_text)):
+            # Re-construct the ID used in Colab
+            yield f"{doc_id}_monster_sub_{i}", sub_text
+
+
+def expand_monster_chunks():
+    """
+    Writes MONSTER_SUB_CHUNKS_FILE from MONSTER_FILE.
+    The file is written to a temporary path and swapped in when complete.
+    """
+    if not os.path.exists(MONSTER_FILE):
+        log.error(f"Monster chunks file not found at {MONSTER_FILE}. Aborting.")
+        return
+
+    total = 0
+    tmp_path = MONSTER_SUB_CHUNKS_FILE + '.tmp'
+    try:
+        with JsonlWriter(tmp_path, 'wb') as writer:
+            for sub_id, sub_text in iter_monster_sub_chunks(MONSTER_FILE):
+                writer.write({"sub_id": sub_id, "text": sub_text})
+                total += 1
+        os.replace(tmp_path, MONSTER_SUB_CHUNKS_FILE)
+    except IOError as e:
+        log.error(f"Error writing {MONSTER_SUB_CHUNKS_FILE}: {e}")
+        return
+
+    log.info(f"Wrote {total} monster sub-chunks to {MONSTER_SUB_CHUNKS_FILE}.")
+
+
+if __name__ == "__main__":
+    expand_monster_chunks()
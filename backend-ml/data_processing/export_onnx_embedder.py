@@ -0,0 +1,46 @@
+"""
+One-shot script that exports the query embedding model to ONNX.
+
+Exports BAAI/bge-m3 to ONNX and adds an int8 dynamically quantized copy
+(ONNX Runtime, tuned for ONNX_QUANTIZATION, e.g. AVX-512 VNNI CPUs) to
+'models/bge-m3-onnx/'. The RAG Agent loads it with EMBEDDING_BACKEND=onnx.
+
+Run from backend-ml/ as a module: python -m data_processing.export_onnx_embedder
+Requires: pip install "sentence-transformers[onnx]"
+"""
+
+import logging
+
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+from rag_agent.embedder import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR, ONNX_MODEL_FILE, ONNX_QUANTIZATION
+
+# --- Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+log = logging.getLogger(__name__)
+
+
+def export_onnx_embedder():
+    """
+    Writes the fp32 ONNX model and its int8 quantized version to ONNX_MODEL_DIR.
+    """
+    log.info(f"Exporting {EMBEDDING_MODEL_NAME} to ONNX...")
+    # backend="onnx" exports the transformer on load (no ONNX file on the Hub)
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx")
+    model.save_pretrained(str(ONNX_MODEL_DIR))
+
+    log.info(f"Quantizing to int8 ({ONNX_QUANTIZATION})...")
+    export_dynamic_quantized_onnx_model(
+        model,
+        quantization_config=ONNX_QUANTIZATION,
+        model_name_or_path=str(ONNX_MODEL_DIR)
+    )
+
+    log.info(f"Quantized model written to {ONNX_MODEL_DIR / ONNX_MODEL_FILE}.")
+
+
+if __name__ == "__main__":
+    export_onnx_embedder()
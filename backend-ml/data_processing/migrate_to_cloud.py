@@ -1,8 +1,9 @@
+import asyncio
 import os
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models
 from tqdm import tqdm
 
@@ -23,9 +24,67 @@ LOCAL_QDRANT_URL = "http://localhost:6333"
 CLOUD_QDRANT_URL = os.getenv("QDRANT_HOST")
 CLOUD_QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = "boe_legal_docs"
+# Points per scroll page / upsert (tune to the link and the vector size)
+BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", 512))
+# Upserts in flight at the same time (hides the round-trip to Cloud)
+UPLOAD_CONCURRENCY = int(os.getenv("MIGRATION_UPLOAD_CONCURRENCY", 4))
+# gRPC sends vectors as packed floats (~4x smaller than JSON arrays).
+# Set MIGRATION_PREFER_GRPC=false if port 6334 is blocked on your network.
+PREFER_GRPC = os.getenv("MIGRATION_PREFER_GRPC", "true").lower() == "true"
+
+
+async def _scroll_local(client_local: AsyncQdrantClient, queue: asyncio.Queue):
+    """
+    Producer: pages through the local collection and queues each page.
+    The bounded queue makes scrolling wait when uploads fall behind.
+    """
+    scroll_offset = None
+    while True:
+        # A. Fetch 'Record' objects from Local
+        records, next_offset = await client_local.scroll(
+            collection_name=COLLECTION_NAME,
+            offset=scroll_offset,
+            limit=BATCH_SIZE,
+            with_payload=True,
+            with_vectors=True
+        )
+
+        if records:
+            await queue.put(records)
+
+        # Advance the cursor
+        scroll_offset = next_offset
+
+        # Si next_offset es None, hemos terminado
+        if not records or next_offset is None:
+            break
+
+    # One stop signal per uploader
+    for _ in range(UPLOAD_CONCURRENCY):
+        await queue.put(None)
+
+
+async def _upload_cloud(client_cloud: AsyncQdrantClient, queue: asyncio.Queue, pbar: tqdm):
+    """
+    Consumer: uploads queued pages to Cloud until it receives None.
+    Several consumers run at once so upload round-trips overlap.
+    """
+    while (records := await queue.get()) is not None:
+        # B. Upload the page to Cloud as a single columnar batch
+        await client_cloud.upsert(
+            collection_name=COLLECTION_NAME,
+            points=models.Batch(
+                ids=[point.id for point in records],
+                vectors=[point.vector for point in records],
+                payloads=[point.payload for point in records]
+            )
+        )
 
+        # Update progress
+        pbar.update(len(records))
 
-def migrate_vectors():
+
+async def migrate_vectors():
     print("🚀 Starting Vector Migration: Local -> Cloud")
 
     # 1. Credentials Check
@@ -33,26 +92,29 @@ def migrate_vectors():
         logger.error("Missing Cloud credentials. Check your .env file.")
         return
 
-    # 2. Connect Clients
-    client_local = QdrantClient(url=LOCAL_QDRANT_URL)
-    client_cloud = QdrantClient(url=CLOUD_QDRANT_URL, api_key=CLOUD_QDRANT_API_KEY)
+    # 2. Connect Clients (gRPC: vectors travel as packed floats, not JSON arrays)
+    client_local = AsyncQdrantClient(url=LOCAL_QDRANT_URL, prefer_grpc=PREFER_GRPC)
+    client_cloud = AsyncQdrantClient(url=CLOUD_QDRANT_URL, api_key=CLOUD_QDRANT_API_KEY, prefer_grpc=PREFER_GRPC)
+    print(f"🔌 Transport: {'gRPC' if PREFER_GRPC else 'HTTP'} | batch size {BATCH_SIZE} | {UPLOAD_CONCURRENCY} concurrent uploads")
 
     # 3. Validation & Schema Replication
     try:
-        collection_info = client_local.get_collection(COLLECTION_NAME)
+        collection_info = await client_local.get_collection(COLLECTION_NAME)
         local_count = collection_info.points_count
         vector_params = collection_info.config.params.vectors
         
         print(f"✅ Connected to Local. Found {local_count} vectors.")
 
-        if not client_cloud.collection_exists(COLLECTION_NAME):
+        if not await client_cloud.collection_exists(COLLECTION_NAME):
             print(f"☁️  Creating collection '{COLLECTION_NAME}' in Cloud...")
-            client_cloud.create_collection(
+            await client_cloud.create_collection(
                 collection_name=COLLECTION_NAME,
                 vectors_config=models.VectorParams(
                     size=vector_params.size,
                     distance=vector_params.distance
-                )
+                ),
+                # Keep the local quantization (int8 search + rescoring), if any
+                quantization_config=collection_info.config.quantization_config
             )
             print("✅ Collection created.")
         else:
@@ -62,63 +124,34 @@ def migrate_vectors():
         logger.error(f"Initialization error: {e}")
         return
 
-    # 4. Migration Loop
+    # 4. Migration Pipeline
+    # The next page is scrolled while the previous ones are still uploading
     print("📦 Migrating data...")
-    
-    scroll_offset = None
-    total_migrated = 0
-    batch_size = 100 
-    
-    pbar = tqdm(total=local_count, unit="vectors")
 
-    while True:
-        try:
-            # A. Fetch 'Record' objects from Local
-            records, next_offset = client_local.scroll(
-                collection_name=COLLECTION_NAME,
-                offset=scroll_offset,
-                limit=batch_size,
-                with_payload=True,
-                with_vectors=True
-            )
-
-            if not records:
-                break
-
-            # Transform 'Record' objects to 'PointStruct'
-            points_to_upsert = [
-                models.PointStruct(
-                    id=point.id,
-                    vector=point.vector,
-                    payload=point.payload
-                ) for point in records
-            ]
-
-            # B. Upload 'PointStruct' objects to Cloud
-            client_cloud.upsert(
-                collection_name=COLLECTION_NAME,
-                points=points_to_upsert
-            )
-
-            # Update progress
-            batch_len = len(records)
-            total_migrated += batch_len
-            pbar.update(batch_len)
-
-            # Advance the cursor
-            scroll_offset = next_offset
-            
-            # Si next_offset es None, hemos terminado
-            if next_offset is None:
-                break
+    queue = asyncio.Queue(maxsize=UPLOAD_CONCURRENCY * 2)
+    pbar = tqdm(total=local_count, unit="vectors")
 
-        except Exception as e:
-            logger.error(f"Error migrating batch: {e}")
+    tasks = [asyncio.create_task(_scroll_local(client_local, queue))]
+    tasks += [
+        asyncio.create_task(_upload_cloud(client_cloud, queue, pbar))
+        for _ in range(UPLOAD_CONCURRENCY)
+    ]
+    # Stop everything on the first error (as the serial loop did)
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if task.exception() is not None:
+            logger.error(f"Error migrating batch: {task.exception()}")
             break
 
+    total_migrated = pbar.n
     pbar.close()
+    await client_local.close()
+    await client_cloud.close()
     print(f"\n✨ Migration Complete! Transferred {total_migrated}/{local_count} vectors.")
 
 
 if __name__ == "__main__":
-    migrate_vectors()
\ No newline at end of file
+    asyncio.run(migrate_vectors())
@@ -3,9 +3,13 @@ Main FastAPI Application for the ML Backend.
 Initializes the app and includes all routers.
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from boe_ingestion.router import router as boe_router
-from rag_agent.router import router as rag_router
+from boe_ingestion.orchestrator import shutdown_parse_pool
+from boe_ingestion.services import api_client
+from rag_agent.router import router as rag_router, evaluation_store, shutdown_evaluation
+from rag_agent.service import rag_service
 import uvicorn
 import os
 import logging
@@ -20,10 +24,35 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Manages resources shared across requests.
+
+    A single pooled HTTP client is created at startup and reused by
+    every BOE ingestion run, then closed on shutdown together with
+    the XML parsing and evaluation worker processes, the query
+    embedding batcher, the evaluation store and the RAG service's
+    Qdrant and Groq clients.
+    """
+    app.state.http_client = api_client.create_client()
+    try:
+        yield
+    finally:
+        await app.state.http_client.aclose()
+        shutdown_parse_pool()
+        await rag_service.embed_batcher.aclose()
+        await shutdown_evaluation()
+        await evaluation_store.aclose()
+        await rag_service.qdrant.close()
+        await rag_service.groq_client.close()
+
+
 app = FastAPI(
     title="ML Backend Service",
     description="Provides ML inference and data ingestion services.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 @app.get("/status")
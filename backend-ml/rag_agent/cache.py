@@ -0,0 +1,131 @@
+"""
+In-process caches for the RAG Agent.
+
+Legal questions repeat a lot ("¿Qué es el IMV?"...). When the same question
+(normalized) retrieves the same documents for the same model and history,
+the answer generated the first time is replayed instead of calling Groq
+again. Near-duplicate questions (same meaning, different wording) reuse
+the retrieved context instead of searching Qdrant again.
+"""
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import orjson
+
+log = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """
+    LRU cache of generated answers with a time-to-live.
+
+    Keys hash everything the answer depends on: the normalized query, the
+    retrieved source IDs (as a set), the model and the chat history sent
+    to it. Entries expire after ttl seconds so that re-indexed documents
+    are eventually reflected in the answers.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expiry time, answer); ordered from least to most recently used
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    @staticmethod
+    def make_key(query: str, source_ids: List[str], model: str, history: List[Dict[str, Any]]) -> str:
+        """
+        Builds the cache key for an interaction.
+        """
+        payload = orjson.dumps({
+            "query_norm": " ".join(query.lower().split()),
+            "sources": sorted(source_ids),
+            "model": model,
+            "history": history,
+        })
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached answer, or None if missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def set(self, key: str, answer: str):
+        """
+        Stores an answer, evicting the least recently used one when full.
+        """
+        self._entries[key] = (time.monotonic() + self.ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SemanticCache:
+    """
+    Cache of retrieval results keyed by query embedding.
+
+    A query whose embedding has a cosine similarity of at least `threshold`
+    with a cached one gets that query's result back, skipping the vector
+    search. The embeddings are unit-length, so the similarities against
+    every entry are a single matrix-vector product.
+
+    Entries live in a fixed (maxsize x dim) float32 matrix, filled as a
+    ring (the oldest entry is overwritten when full), and expire after
+    ttl seconds so that re-indexed documents are eventually retrieved.
+    """
+
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.95, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        # Allocated on the first set(), once the embedding size is known
+        self._vectors: Optional[np.ndarray] = None
+        self._expires = np.full(maxsize, -np.inf)
+        self._values: List[Any] = [None] * maxsize
+        self._next = 0
+
+    def get(self, vector: np.ndarray) -> Optional[Any]:
+        """
+        Returns the result cached for the most similar query,
+        or None if none is similar enough (or it expired).
+        """
+        if self._vectors is None:
+            return None
+        sims = self._vectors @ vector
+        sims[self._expires < time.monotonic()] = -np.inf
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return self._values[best]
+
+    def set(self, vector: np.ndarray, value: Any):
+        """
+        Stores the result of a query, overwriting the oldest entry when full.
+        """
+        if self.maxsize <= 0:
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+        slot = self._next
+        self._vectors[slot] = vector
+        self._expires[slot] = time.monotonic() + self.ttl
+        self._values[slot] = value
+        self._next = (slot + 1) % self.maxsize
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires >= time.monotonic()))
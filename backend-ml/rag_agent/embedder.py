@@ -0,0 +1,228 @@
+"""
+Query embeddings for the RAG Agent: model loading and micro-batching.
+
+Encoding one query at a time pays the full Python -> PyTorch dispatch for a
+single short sequence. Concurrent queries are instead coalesced for a few
+milliseconds and encoded together in a single forward pass.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, List
+
+import httpx
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Same model as the one used to index the collection
+EMBEDDING_MODEL_NAME = "BAAI/bge-m3"
+# "torch" (PyTorch, in-process), "onnx" (ONNX Runtime, int8 dynamic
+# quantization: several times faster on CPU) or "tei" (a text-embeddings-
+# inference server at TEI_URL, shared by every worker: no model in-process).
+# The ONNX model must be exported first with
+# python -m data_processing.export_onnx_embedder
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+TEI_URL = os.getenv("TEI_URL", "http://tei:80")
+TEI_TIMEOUT = float(os.getenv("TEI_TIMEOUT", 10.0))
+# Resolves to backend-ml/models/bge-m3-onnx/
+ONNX_MODEL_DIR = Path(__file__).resolve().parent.parent / "models" / "bge-m3-onnx"
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx512_vnni")
+ONNX_MODEL_FILE = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+
+
+def load_embedder(backend: str = EMBEDDING_BACKEND):
+    """
+    Loads the query embedding model for the given backend
+    (the configured EMBEDDING_BACKEND by default).
+
+    The torch and onnx backends go through SentenceTransformer, so the
+    pooling (CLS for BGE-M3) and normalization stay exactly those of the
+    indexed vectors; TEI applies the model's own pooling config too.
+    """
+    if backend == "tei":
+        log.info(f"Using the text-embeddings-inference server at {TEI_URL}...")
+        return TeiEmbedder(TEI_URL)
+
+    # Imported here: loading torch/onnxruntime is only needed with a model
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        log.info(f"Loading Embedding Model ({ONNX_MODEL_DIR / ONNX_MODEL_FILE}, ONNX Runtime)...")
+        return SentenceTransformer(
+            str(ONNX_MODEL_DIR), backend="onnx", model_kwargs={"file_name": ONNX_MODEL_FILE}
+        )
+    import torch
+
+    if torch.cuda.is_available():
+        # Half precision on GPU: half the memory traffic of the matmuls, with
+        # negligible drift in the cosine scores. (On CPU, fp16 kernels are
+        # slower than fp32: the int8 ONNX backend is the fast option there.)
+        dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        # TF32 for the float32 operations left (Ampere and newer)
+        torch.set_float32_matmul_precision("high")
+        log.info(f"Loading Embedding Model ({EMBEDDING_MODEL_NAME}, CUDA {dtype})...")
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, model_kwargs={"torch_dtype": dtype})
+    log.info(f"Loading Embedding Model ({EMBEDDING_MODEL_NAME})...")
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+class TeiEmbedder:
+    """
+    SentenceTransformer-like client of a text-embeddings-inference server.
+
+    TEI batches requests from every client with length-sorted, minimally
+    padded batches, so one server replaces a model copy per process.
+    """
+
+    def __init__(self, url: str, client: httpx.Client | None = None):
+        self.url = url.rstrip("/")
+        # One pooled connection for every call (encode runs in worker threads)
+        self.client = client or httpx.Client(timeout=TEI_TIMEOUT)
+
+    def encode(self, texts, normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        """Embeds a text (1-D result) or a list of texts (one row each)."""
+        single = isinstance(texts, str)
+        response = self.client.post(
+            f"{self.url}/embed",
+            json={"inputs": [texts] if single else list(texts), "normalize": normalize_embeddings}
+        )
+        response.raise_for_status()
+        vectors = np.asarray(response.json(), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent encode() calls into batched embedder.encode() calls.
+
+    Queries are collected for at most `window` seconds after the first one
+    arrives (up to `max_batch`), encoded in one call in a worker thread,
+    and each caller gets its own row back.
+
+    get_embedder returns the model (anything with a SentenceTransformer-like
+    encode()). It is called in the worker thread, so a lazily loaded
+    model is loaded there, off the event loop.
+
+    The embeddings of the last cache_size distinct texts are kept (LRU,
+    ~4KB each): a repeated query skips tokenization and the forward pass.
+    """
+
+    def __init__(
+        self,
+        get_embedder: Callable[[], Any],
+        max_batch: int = 16,
+        window: float = 0.010,
+        cache_size: int = 4096
+    ):
+        self.get_embedder = get_embedder
+        self.max_batch = max_batch
+        self.window = window
+        self.cache_size = cache_size
+        # text -> embedding (read-only array), least recently used first
+        self._cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        # Batching queue and its worker, created on first use inside the
+        # running event loop (and again if a new loop takes over)
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def encode(self, text: str) -> np.ndarray:
+        """
+        Returns the embedding of a single text, from the cache or
+        batched with any concurrent calls.
+        """
+        vector = self._cache.get(text)
+        if vector is not None:
+            self._cache.move_to_end(text)
+            return vector
+
+        # The queue and its worker belong to the loop that created them:
+        # one left over from a previous loop (e.g. an earlier test or app
+        # run) can't be awaited here, so it is replaced
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._batch_worker())
+            self._loop = loop
+
+        future = loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _batch_worker(self):
+        """
+        Background task: drains the queue in batches and resolves each
+        caller's future with its row of the batch.
+        """
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                # Encoding is CPU-bound: keep the event loop free while it runs
+                vectors = await asyncio.to_thread(self._encode_batch, [text for text, _ in batch])
+            except asyncio.CancelledError:
+                # Shutting down: don't leave the callers of this batch waiting
+                for _, future in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                log.error(f"Batched embedding of {len(batch)} queries failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (text, future), vector in zip(batch, vectors):
+                self._remember(text, vector)
+                if not future.done():
+                    future.set_result(vector)
+
+    async def aclose(self):
+        """
+        Stops the batching worker (called on application shutdown).
+        Queries still queued are cancelled; the cache is kept.
+        """
+        if self._worker is not None and self._loop is asyncio.get_running_loop():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+    def _remember(self, text: str, vector: np.ndarray):
+        """Caches an embedding, evicting the least recently used one when full."""
+        if self.cache_size <= 0:
+            return
+        # Shared by every caller of this text: make sure none can modify it
+        vector.flags.writeable = False
+        self._cache[text] = vector
+        self._cache.move_to_end(text)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        # Unit-length vectors: consistent value ranges for the int8 quantized search
+        vectors = self.get_embedder().encode(
+            texts, batch_size=self.max_batch, normalize_embeddings=True, convert_to_numpy=True
+        )
+        # Contiguous float32 rows (the collection's vector type) are handed
+        # to the Qdrant client as they are: no per-request copy or cast
+        return np.ascontiguousarray(vectors, dtype=np.float32)
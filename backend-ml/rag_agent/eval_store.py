@@ -0,0 +1,163 @@
+"""
+On-disk store of the Ragas evaluations, keyed by message ID.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+log = logging.getLogger(__name__)
+
+
+class EvaluationStore:
+    """
+    Persists the metrics of each evaluated message.
+
+    Backed by a single SQLite table with message_id as PRIMARY KEY, so a
+    lookup is one B-tree search (only the hit row is decoded) instead of
+    a scan over every stored evaluation. The database runs in WAL mode:
+    the frontend polls for metrics while background tasks write them.
+
+    Writes from the event loop go through enqueue(): a single writer task
+    collects the rows for write_window seconds and stores them in one
+    transaction in a worker thread, so the loop never blocks on disk.
+
+    The connection is opened on first use. Store failures are logged and
+    treated as misses: they never break a chat request.
+    """
+
+    def __init__(self, db_path: str, write_window: float = 0.1):
+        self.db_path = db_path
+        self.write_window = write_window
+        self._conn: Optional[sqlite3.Connection] = None
+        # The connection is used from the event loop and the writer's thread
+        self._lock = threading.Lock()
+        # Write queue and its writer, created on first use inside the
+        # running event loop (and again if a new loop takes over)
+        self._queue: asyncio.Queue | None = None
+        self._writer: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Rows taken off the queue but not yet handed to put_many
+        self._pending: List[Tuple[str, str, Dict[str, float], str]] = []
+        # The put_many running in a worker thread, if any
+        self._in_flight: asyncio.Future | None = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            # Shared by the request handlers and the background tasks
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS evaluations ("
+                "message_id TEXT PRIMARY KEY, query TEXT, metrics TEXT NOT NULL, tier TEXT)"
+            )
+        return self._conn
+
+    def put(self, message_id: str, query: str, metrics: Dict[str, float], tier: str):
+        """Stores (or replaces) the metrics of a message, synchronously."""
+        self.put_many([(message_id, query, metrics, tier)])
+
+    def put_many(self, rows: List[Tuple[str, str, Dict[str, float], str]]):
+        """Stores several (message_id, query, metrics, tier) rows in one transaction."""
+        try:
+            with self._lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO evaluations (message_id, query, metrics, tier) VALUES (?, ?, ?, ?)",
+                    [
+                        (message_id, query, orjson.dumps(metrics).decode(), tier)
+                        for message_id, query, metrics, tier in rows
+                    ]
+                )
+        except sqlite3.Error as e:
+            log.error(f"Evaluation store insert of {len(rows)} row(s) failed: {e}")
+
+    def enqueue(self, message_id: str, query: str, metrics: Dict[str, float], tier: str):
+        """
+        Queues the metrics of a message for the background writer
+        (call from the event loop; returns immediately).
+        """
+        # The queue and its writer belong to the loop that created them:
+        # a writer left over from a previous loop never runs again, so
+        # the rows it hadn't written yet move to the new queue
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            rows, self._pending = self._pending, []
+            while self._queue is not None and not self._queue.empty():
+                rows.append(self._queue.get_nowait())
+            self._queue = asyncio.Queue()
+            for row in rows:
+                self._queue.put_nowait(row)
+            self._in_flight = None
+            self._writer = asyncio.create_task(self._write_worker())
+            self._loop = loop
+        self._queue.put_nowait((message_id, query, metrics, tier))
+
+    async def _write_worker(self):
+        """
+        Background task: writes the queued rows in batches, one
+        transaction (and one disk sync) per write_window.
+        """
+        while True:
+            self._pending.append(await self._queue.get())
+            await asyncio.sleep(self.write_window)
+            while not self._queue.empty():
+                self._pending.append(self._queue.get_nowait())
+            rows, self._pending = self._pending, []
+            # shield: cancelling the writer must not abandon a batch mid-write
+            # (the thread keeps running anyway); aclose() waits for it instead
+            self._in_flight = asyncio.ensure_future(asyncio.to_thread(self.put_many, rows))
+            await asyncio.shield(self._in_flight)
+            self._in_flight = None
+
+    async def aclose(self):
+        """
+        Stops the writer, waits for the batch it may be writing, stores the
+        rows still queued and closes the connection.
+        """
+        # A writer (and its batch) from another loop can't be awaited here
+        same_loop = self._loop is asyncio.get_running_loop()
+        if self._writer is not None and same_loop:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+        self._writer = None
+        if self._in_flight is not None and same_loop:
+            await self._in_flight
+        self._in_flight = None
+        self._loop = None
+        if self._queue is not None:
+            rows, self._pending = self._pending, []
+            while not self._queue.empty():
+                rows.append(self._queue.get_nowait())
+            if rows:
+                self.put_many(rows)
+            self._queue = None
+        self.close()
+
+    def get(self, message_id: str) -> Optional[Dict[str, float]]:
+        """Returns the stored metrics, or None if the message has none (yet)."""
+        try:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT metrics FROM evaluations WHERE message_id = ?", (message_id,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            log.error(f"Evaluation store lookup failed for {message_id}: {e}")
+            return None
+        return orjson.loads(row[0]) if row else None
+
+    def close(self):
+        # The lock waits for a put_many still running in the writer's thread
+        # (it outlives a cancelled writer task), so its batch is committed
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
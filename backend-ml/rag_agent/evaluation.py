@@ -5,12 +5,15 @@ This module implements an 'LLM-as-a-Judge' evaluator using local Ollama models
 to assess the quality of RAG interactions. It calculates metrics such as
 Faithfulness and Answer Relevancy to ensure the agent's reliability.
 """
+import asyncio
 import logging
 import os
 import math
-from typing import List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple
 from ragas import evaluate
 from ragas.metrics import faithfulness, answer_relevancy
+from ragas.run_config import RunConfig
 from datasets import Dataset
 from langchain_ollama import ChatOllama
 from langchain_community.embeddings import OllamaEmbeddings
@@ -24,12 +27,35 @@ JUDGE_MODEL_NAME = "llama3.1:8b"
 # Network Configuration for Docker
 OLLAMA_BASE_URL = os.getenv("OLLAMA_HOST", "http://host.docker.internal:11434")
 
+# Interactions are evaluated in batches: up to EVAL_BATCH_SIZE rows, collected
+# for at most EVAL_BATCH_WINDOW seconds after the first one arrives
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", 8))
+EVAL_BATCH_WINDOW = float(os.getenv("EVAL_BATCH_WINDOW", 2.0))
+
+# Ragas runs each (row, metric) judge call as an async job on ChatOllama's
+# async client. Up to EVAL_MAX_WORKERS of them are in flight at once, so
+# faithfulness and answer_relevancy calls overlap instead of queuing.
+# The Ollama server only runs them in parallel with OLLAMA_NUM_PARALLEL > 1.
+EVAL_MAX_WORKERS = int(os.getenv("EVAL_MAX_WORKERS", 4))
+
+# Ragas runs in a separate process: its CPU work (dataset building, result
+# parsing, the event loop driving the judge calls) holds the GIL for
+# seconds and would otherwise stall the streaming of the chat answers.
+# Batches are scored one at a time, so one process is enough.
+EVAL_PROCESSES = int(os.getenv("EVAL_PROCESSES", 1))
+_eval_pool: ProcessPoolExecutor | None = None
+
 class EvaluationService:
     """
     Service responsible for running quality evaluations on RAG traces.
     """
 
     def __init__(self):
+        # Batching queue and its worker, created on first use inside the
+        # running event loop (and again if a new loop takes over)
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
         try:
             log.info(f"Initializing Evaluation Service connecting to: {OLLAMA_BASE_URL}")
             
@@ -49,7 +75,7 @@ class EvaluationService:
             log.error(f"Failed to initialize Evaluation Service: {e}")
             self.judge_llm = None
 
-    def evaluate_interaction(
+    async def evaluate_interaction(
         self, 
         query: str, 
         response: str, 
@@ -57,18 +83,100 @@ class EvaluationService:
     ) -> Dict[str, float]:
         """
         Evaluates a single RAG interaction (Trace) using Ragas metrics.
-        Sanitizes output to prevent JSON serialization errors with NaN/Inf.
+
+        The interaction is queued and scored together with the others that
+        arrive within EVAL_BATCH_WINDOW seconds (up to EVAL_BATCH_SIZE), in a
+        single Ragas run, which amortizes the judge's per-call overhead.
+        Returns this interaction's scores, or {} if the evaluation failed.
         """
         if not self.judge_llm:
             log.warning("Skipping evaluation: Judge LLM is not initialized.")
             return {}
 
-        log.info("⚖️ Starting Ragas Evaluation for current interaction...")
+        # The queue and its worker belong to the loop that created them:
+        # one left over from a previous loop can't be awaited here
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._batch_worker())
+            self._loop = loop
+
+        future = loop.create_future()
+        await self._queue.put(((query, response, retrieved_contexts), future))
+        return await future
+
+    async def _batch_worker(self):
+        """
+        Background task: drains the queue in batches and resolves each
+        interaction's future with its own row of scores.
+        """
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + EVAL_BATCH_WINDOW
+            while len(batch) < EVAL_BATCH_SIZE:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            interactions = [interaction for interaction, _ in batch]
+            # Ragas is blocking and CPU-heavy: run it outside this process
+            try:
+                scores = await asyncio.get_running_loop().run_in_executor(
+                    _get_eval_pool(), _evaluate_batch_in_worker, interactions
+                )
+            except asyncio.CancelledError:
+                # Shutting down: don't leave the callers of this batch waiting
+                for _, future in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                log.error(f"Evaluation worker failed for {len(batch)} interaction(s): {e}")
+                scores = [{} for _ in batch]
+            for (_, future), row_scores in zip(batch, scores):
+                if not future.done():
+                    future.set_result(row_scores)
+
+    async def aclose(self):
+        """
+        Stops the batching worker (called on application shutdown).
+        Interactions still queued are cancelled, not evaluated.
+        """
+        if self._worker is not None and self._loop is asyncio.get_running_loop():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+    def evaluate_batch(self, interactions: List[Tuple[str, str, List[str]]]) -> List[Dict[str, float]]:
+        """
+        Evaluates several (query, response, retrieved_contexts) interactions
+        in one Ragas run, with one row per interaction.
+        Sanitizes output to prevent JSON serialization errors with NaN/Inf.
+
+        Returns:
+            One dict of scores per interaction, in order ({} on failure).
+        """
+        if not self.judge_llm:
+            log.warning("Skipping evaluation: Judge LLM is not initialized.")
+            return [{} for _ in interactions]
+
+        log.info(f"⚖️ Starting Ragas Evaluation for {len(interactions)} interaction(s)...")
 
         data = {
-            'question': [query],
-            'answer': [response],
-            'contexts': [retrieved_contexts],
+            'question': [query for query, _, _ in interactions],
+            'answer': [response for _, response, _ in interactions],
+            'contexts': [contexts for _, _, contexts in interactions],
         }
         dataset = Dataset.from_dict(data)
         metrics = [faithfulness, answer_relevancy]
@@ -80,9 +188,10 @@ class EvaluationService:
                 llm=self.judge_llm,
                 embeddings=self.embeddings,
                 raise_exceptions=False,
+                run_config=RunConfig(max_workers=EVAL_MAX_WORKERS),
             )
 
-            scores = results.to_pandas().iloc[0].to_dict()
+            rows = results.to_pandas().to_dict("records")
             
             # --- SANITIZATION LOGIC ---
             def safe_score(val):
@@ -94,17 +203,47 @@ class EvaluationService:
                 except (ValueError, TypeError):
                     return 0.0
 
-            final_metrics = {
-                "faithfulness": safe_score(scores.get("faithfulness")),
-                "answer_relevancy": safe_score(scores.get("answer_relevancy"))
-            }
+            final_metrics = [
+                {
+                    "faithfulness": safe_score(scores.get("faithfulness")),
+                    "answer_relevancy": safe_score(scores.get("answer_relevancy"))
+                }
+                for scores in rows
+            ]
             
             log.info(f"✅ Evaluation complete. Scores: {final_metrics}")
             return final_metrics
 
         except Exception as e:
             log.error(f"❌ Critical error during Ragas evaluation: {e}", exc_info=True)
-            return {}
+            return [{} for _ in interactions]
+
+def _get_eval_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used for the Ragas runs, creating it on first use.
+    """
+    global _eval_pool
+    if _eval_pool is None:
+        _eval_pool = ProcessPoolExecutor(max_workers=EVAL_PROCESSES)
+    return _eval_pool
+
+
+def shutdown_eval_pool():
+    """
+    Stops the evaluation worker processes (called on application shutdown).
+    """
+    global _eval_pool
+    if _eval_pool is not None:
+        _eval_pool.shutdown(cancel_futures=True)
+        _eval_pool = None
+
+
+def _evaluate_batch_in_worker(interactions: List[Tuple[str, str, List[str]]]) -> List[Dict[str, float]]:
+    """
+    Entry point of the worker processes: scores a batch with the worker's
+    own EvaluationService (its judge clients are created on import there).
+    """
+    return evaluation_service.evaluate_batch(interactions)
 
 # Singleton instance to be imported by the router
 evaluation_service = EvaluationService()
\ No newline at end of file
@@ -1,21 +1,115 @@
 """
 API Router for the RAG Agent.
-Handles chat endpoints without heavy evaluation overhead.
+Handles chat endpoints and the optional background evaluation of answers.
 """
+import asyncio
 import logging
-from fastapi import APIRouter, Header
+import os
+import sys
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Dict
+
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import StreamingResponse
-from .schemas import ChatRequest
+from .schemas import ChatRequest, EvaluationResponse
+from .eval_store import EvaluationStore
 from .service import rag_service
 
 # Setup logging
 log = logging.getLogger(__name__)
 
+# Ragas evaluation of each answer (LLM-as-a-Judge on Ollama). Off by default:
+# it needs a reachable Ollama instance and competes with it for resources.
+EVALUATION_ENABLED = os.getenv("ENABLE_EVALUATION", "false").lower() == "true"
+# Resolves to backend-ml/data/evaluations.db
+EVAL_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "evaluations.db"
+
+# Evaluations waiting or running: beyond that, new answers aren't evaluated
+# (how many reach the judge at once is up to the evaluation service's batches)
+EVAL_MAX_PENDING = int(os.getenv("EVAL_MAX_PENDING", 32))
+
+evaluation_store = EvaluationStore(str(EVAL_DB_PATH))
+# Strong references to the evaluation tasks (the loop only keeps weak ones)
+_pending_evals: set[asyncio.Task] = set()
+
+# The answer is streamed as raw text chunks (the BFF forwards and stores
+# them verbatim). These headers stop proxies (e.g. nginx) from buffering
+# the stream, so each chunk reaches the client as soon as it is generated.
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
 router = APIRouter(
     prefix="/chat",
     tags=["Agent RAG"]
 )
 
+async def run_evaluation_task(message_id: str, query: str, captured: Dict[str, Any], user_tier: str):
+    """
+    Background task: scores the answer that was just streamed to the user.
+
+    The answer and its context come from 'captured' (filled in while
+    streaming), so nothing is generated a second time for the evaluation.
+    The evaluation service batches it with other pending answers; the
+    metrics are queued for the evaluation store's batched writer.
+    """
+    if not captured["text"]:
+        log.warning(f"Skipping evaluation of {message_id}: empty answer.")
+        return
+
+    # Imported here: Ragas and its judge are only loaded when evaluating
+    from .evaluation import evaluation_service
+
+    metrics = await evaluation_service.evaluate_interaction(
+        query, captured["text"], [captured["context"]]
+    )
+    if not metrics:
+        return
+
+    # Written in the background, batched with other evaluations
+    evaluation_store.enqueue(message_id, query, metrics, user_tier)
+    log.info(f"Queued evaluation of {message_id} for storage.")
+
+async def shutdown_evaluation():
+    """
+    Stops the evaluation batching worker and worker processes, if any
+    evaluation ever ran (called on application shutdown; doesn't import
+    Ragas otherwise).
+    """
+    evaluation = sys.modules.get(f"{__package__}.evaluation")
+    if evaluation is not None:
+        await evaluation.evaluation_service.aclose()
+        evaluation.shutdown_eval_pool()
+
+def _schedule_evaluation(message_id: str, query: str, captured: Dict[str, Any], user_tier: str):
+    """
+    Starts run_evaluation_task in the background, unless EVAL_MAX_PENDING
+    evaluations are already queued (the evaluation is then skipped, so
+    a burst of chats never builds an unbounded backlog for the judge).
+    """
+    if len(_pending_evals) >= EVAL_MAX_PENDING:
+        log.warning(f"Skipping evaluation of {message_id}: {len(_pending_evals)} evaluations pending.")
+        return
+    task = asyncio.create_task(run_evaluation_task(message_id, query, captured, user_tier))
+    _pending_evals.add(task)
+    task.add_done_callback(_pending_evals.discard)
+
+async def _stream_and_capture(
+    stream: AsyncGenerator[str, None], captured: Dict[str, Any], on_complete: Callable[[], None]
+) -> AsyncGenerator[str, None]:
+    """
+    Passes the answer chunks through to the client, keeping a copy of the
+    full text in captured["text"]. on_complete is called once the stream
+    is complete (not if the client disconnects midway).
+    """
+    parts = []
+    async for chunk in stream:
+        parts.append(chunk)
+        yield chunk
+    captured["text"] = "".join(parts)
+    on_complete()
+
 @router.post("")
 async def chat_endpoint(
     request: ChatRequest,
@@ -23,11 +117,39 @@ async def chat_endpoint(
 ):
     """
     Streaming chat endpoint.
-     Optimized for low latency: No background evaluation.
+    If evaluation is enabled and the request carries a message_id, the
+    streamed answer is captured and scored in the background afterwards.
     """
-    
-    # Just stream the response directly. No extra tasks.
+    if not (EVALUATION_ENABLED and request.message_id):
+        # Just stream the response directly. No extra tasks.
+        return StreamingResponse(
+            rag_service.chat_stream(request.query, request.history, x_user_tier),
+            media_type="text/event-stream",
+            headers=STREAM_HEADERS
+        )
+
+    # Filled in by chat_stream (context) and _stream_and_capture (answer)
+    captured = {"text": "", "context": "", "sources": []}
     return StreamingResponse(
-        rag_service.chat_stream(request.query, request.history, x_user_tier),
-        media_type="text/event-stream"
-    )
\ No newline at end of file
+        _stream_and_capture(
+            rag_service.chat_stream(request.query, request.history, x_user_tier, capture=captured),
+            captured,
+            on_complete=lambda: _schedule_evaluation(
+                request.message_id, request.query, captured, x_user_tier
+            )
+        ),
+        media_type="text/event-stream",
+        headers=STREAM_HEADERS
+    )
+
+@router.get("/evaluation/{message_id}", response_model=EvaluationResponse)
+async def get_evaluation(message_id: str):
+    """
+    Returns the evaluation metrics of a message.
+    404 while the evaluation is pending (or if the message wasn't evaluated).
+    """
+    metrics = evaluation_store.get(message_id)
+    if metrics is not None:
+        return EvaluationResponse(message_id=message_id, metrics=metrics)
+
+    raise HTTPException(status_code=404, detail="Evaluation pending or not found")
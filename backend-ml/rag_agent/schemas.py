@@ -2,7 +2,7 @@
 Pydantic schemas for the RAG Agent module.
 Defines the data structure for chat requests and responses.
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict
 
 class ChatRequest(BaseModel):
@@ -16,14 +16,19 @@ class ChatRequest(BaseModel):
         description="Unique ID of the message to link evaluations."
     )
 
-    model_config = {
-        "json_schema_extra": {
+    # Validated once per request and never modified afterwards. Unknown
+    # fields are rejected (the BFF sends exactly these three).
+    model_config = ConfigDict(
+        frozen=True,
+        extra="forbid",
+        json_schema_extra={
             "example": {
                 "query": "¿Qué ayudas hay para la instalación de placas solares?",
                 "message_id": "550e8400-e29b-41d4-a716-446655440000"
             }
         }
-    }
+    )
+
 class EvaluationResponse(BaseModel):
     """
     Represents the evaluation metrics for a specific interaction.
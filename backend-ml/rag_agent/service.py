@@ -7,14 +7,20 @@ This module orchestrates the Retrieval-Augmented Generation flow:
 3. Constructs a prompt with the retrieved context.
 4. Calls Groq (Llama 3.3) for high-performance cloud inference.
 """
+import asyncio
 import logging
 import os
-from typing import List, Dict, Any, AsyncGenerator
-from groq import Groq
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
+import threading
+import httpx
+from typing import List, Dict, Any, AsyncGenerator, Iterator, Optional
+from groq import AsyncGroq
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models
 from dotenv import load_dotenv
 
+from .cache import LLMCache, SemanticCache
+from .embedder import EmbeddingBatcher, load_embedder
+
 # Load environment variables
 load_dotenv()
 
@@ -23,11 +29,67 @@ load_dotenv()
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None) # Added for Cloud Support
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
+# gRPC for the searches: the query vector travels as packed floats (protobuf)
+# over one multiplexed HTTP/2 connection, instead of a JSON array over REST
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", 6334))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+# REST connection pool (REST-only calls, or everything if gRPC is disabled)
+QDRANT_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
 COLLECTION_NAME = "boe_legal_docs"
+# HNSW candidate list size per search (Qdrant's default is the index's
+# ef_construct): larger is more accurate, smaller is faster
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", 128))
+# With the collection's int8 quantization: search on the int8 vectors,
+# fetching oversampling x limit candidates, then rescore them in float32.
+# (Ignored by Qdrant if the collection isn't quantized.)
+QDRANT_SEARCH_PARAMS = models.SearchParams(
+    hnsw_ef=QDRANT_HNSW_EF,
+    quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
 
+# Query embedding micro-batching: up to EMBED_BATCH_SIZE concurrent queries,
+# collected for at most EMBED_BATCH_WINDOW seconds, share one encode() call
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 16))
+EMBED_BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW", 0.010))
+# Embeddings of recent distinct queries kept in memory (exact-match LRU)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 4096))
+# Retrieval results of recent queries, reused by near-duplicate queries
+# (cosine similarity >= SEMANTIC_CACHE_THRESHOLD) without searching Qdrant
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 1024))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+
 # Groq Configuration
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GENERATION_TEMPERATURE = 0.3
+
+# Prompt budget, in (estimated) tokens: bounds the prefill of every request,
+# however long the pasted history messages or the retrieved chunks are.
+# Tokens are estimated from the length (Llama 3 averages ~3.5 characters
+# per token on Spanish text), which is enough to enforce a budget.
+CHARS_PER_TOKEN = 3.5
+HISTORY_MAX_MESSAGES = 4
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 2000))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 6000))
+# Appended to a retrieved document cut short by the context budget
+CONTEXT_CUT_MARKER = " […]"
+
+# Instructions shared by every request (the retrieved context is sent apart)
+STATIC_SYSTEM_PROMPT = (
+    "Eres Justiniano, un asistente legal experto en leyes españolas (BOE). "
+    "Usa la siguiente información de contexto (referencias a documentos) para responder. "
+    "Si no puedes responder con certeza, indícalo. "
+    "Responde siempre en español profesional.\n\n"
+    "No pases de los 12000 tokens en la respuesta."
+)
+
+# Response cache: at GENERATION_TEMPERATURE the model gives much the same
+# answer to the same question and sources, so a recent one is reused
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+# Cached (or shared) answers are replayed in chunks of this many characters
+CACHE_REPLAY_CHUNK_CHARS = 32
 
 # Logging Setup
 logging.basicConfig(
@@ -40,7 +102,7 @@ log = logging.getLogger(__name__)
 class RagService:
     def __init__(self):
         """
-        Initializes connections to the Vector DB, loads the Embedding Model,
+        Initializes connections to the Vector DB, prepares the Embedding Model,
         and sets up the Groq Cloud Client.
         """
         log.info("Initializing RAG Service (Cloud Hybrid Mode)...")
@@ -59,129 +121,330 @@ class RagService:
             
         # Mask API key for logging
         masked_key = f"{api_key[:4]}...{api_key[-4:]}" if api_key and len(api_key) > 8 else ("Present" if api_key else "None")
-        log.info(f"Connecting to Qdrant: {host} (Port: {port}, API Key: {masked_key})")
+        log.info(f"Connecting to Qdrant: {host} (Port: {port}, gRPC: {QDRANT_GRPC_PORT if QDRANT_PREFER_GRPC else 'off'}, API Key: {masked_key})")
 
+        # One client (and connection pool) for the whole service. The async
+        # client awaits the search on the event loop instead of blocking it
+        transport_args = {
+            "grpc_port": QDRANT_GRPC_PORT,
+            "prefer_grpc": QDRANT_PREFER_GRPC,
+            "limits": QDRANT_HTTP_LIMITS,
+        }
         if host.startswith("http"):
             # Cloud or explicit URL
-            self.qdrant = QdrantClient(
+            self.qdrant = AsyncQdrantClient(
                 url=host, 
-                api_key=api_key
+                api_key=api_key,
+                **transport_args
             )
         else:
             # Local or Hostname only
             # Force https=False to prevent SSL errors if api_key is present (which defaults https to True)
-            self.qdrant = QdrantClient(
+            self.qdrant = AsyncQdrantClient(
                 host=host, 
                 port=port, 
                 api_key=api_key,
-                https=False
+                https=False,
+                **transport_args
             )
         
-        # 2. Load Embedding Model
-        try:
-            log.info("Loading Embedding Model (BAAI/bge-m3)...")
-            self.embedder = SentenceTransformer('BAAI/bge-m3')
-            log.info("Embedding model loaded successfully.")
-        except Exception as e:
-            log.error(f"Failed to load embedding model: {e}")
-            raise
+        # 2. Embedding Model: loaded on first use (see the embedder property)
+        self._embedder = None
+        self._embedder_lock = threading.Lock()
+        self.embed_batcher = EmbeddingBatcher(
+            lambda: self.embedder,
+            max_batch=EMBED_BATCH_SIZE,
+            window=EMBED_BATCH_WINDOW,
+            cache_size=EMBED_CACHE_SIZE
+        )
+        self.context_cache = SemanticCache(
+            maxsize=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL
+        )
 
         # 3. Initialize Groq Client
         if not GROQ_API_KEY:
             log.warning("GROQ_API_KEY not found. Inference will fail.")
-        self.groq_client = Groq(api_key=GROQ_API_KEY)
+        # Async client: streaming the answer never blocks the event loop
+        self.groq_client = AsyncGroq(api_key=GROQ_API_KEY)
         self.model_name = GROQ_MODEL # Standardizing on the best model for now
 
-    def _get_context(self, query: str, limit: int = 5) -> tuple[str, List[str]]:
+        # 4. Response cache (in-process) and requests being answered right now
+        self.response_cache = LLMCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def embedder(self):
+        """
+        The BGE-M3 embedding model (PyTorch or ONNX, see EMBEDDING_BACKEND),
+        loaded on first access.
+
+        Loading it takes ~2GB of RAM and several seconds, so it isn't done
+        at import time (tests, dev reloads, ingestion-only workers never
+        pay for it). Called from the batcher's worker thread, hence the lock.
+        """
+        if self._embedder is None:
+            with self._embedder_lock:
+                if self._embedder is None:
+                    try:
+                        self._embedder = load_embedder()
+                        log.info("Embedding model loaded successfully.")
+                    except Exception as e:
+                        log.error(f"Failed to load embedding model: {e}")
+                        raise
+        return self._embedder
+
+    async def _get_context(self, query: str, limit: int = 5) -> tuple[str, List[str]]:
         """
         Retrieves relevant context from Qdrant using the local embedder.
+        The query is embedded in a batch with any concurrent queries, and
+        neither step blocks the event loop (worker thread, async client).
         """
         log.info(f"🔍 Searching Qdrant for: '{query}'")
 
         # 1. Vectorize query (Local CPU)
         try:
-            query_vector = self.embedder.encode(query)
+            query_vector = await self.embed_batcher.encode(query)
         except Exception as e:
             log.error(f"Embedding encoding failed: {e}")
             return "", []
 
-        # 2. Search Qdrant (Cloud/Local Network)
+        # 2. A near-duplicate query was answered recently: reuse its context
+        cached = self.context_cache.get(query_vector)
+        if cached is not None:
+            log.info("Semantic cache hit: skipping Qdrant search.")
+            return cached
+
+        # 3. Search Qdrant (Cloud/Local Network)
         try:
-            hits = self.qdrant.query_points(
+            hits = (await self.qdrant.query_points(
                 collection_name=COLLECTION_NAME,
                 query=query_vector,
-                limit=limit
-            ).points
+                limit=limit,
+                search_params=QDRANT_SEARCH_PARAMS
+            )).points
         except Exception as e:
             log.error(f"Qdrant search failed: {e}")
             # Fail gracefully so the chat can continue without context if DB is down
             return "No se pudo acceder a la base de datos legal.", []
 
-        context_text = ""
+        # Pieces are joined once at the end (repeated += copies the growing string)
+        context_parts = []
         source_ids = []
+        # Hits come best first: the least relevant ones are dropped to fit the budget
+        chars_left = int(CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN)
 
         for hit in hits:
             doc_id = hit.payload.get('original_id', 'Unknown')
             doc_text = hit.payload.get('text', 'Content Not Available.')
-            source_ids.append(doc_id)
             
             score = hit.score
             # log.info(f"   -> Hit: {doc_id} (Score: {score:.4f})")
 
-            context_text += f"--- Documento: {doc_id} (Relevancia: {score:.2f}) ---\n"
-            context_text += f"{doc_text}\n\n"
+            header = f"--- Documento: {doc_id} (Relevancia: {score:.2f}) ---\n"
+            part = f"{header}{doc_text}\n\n"
+            if len(part) > chars_left:
+                # The first hit that doesn't fit is kept up to a sentence (or
+                # word) boundary, marked as cut; if too little fits, it's dropped
+                room = chars_left - len(header) - len(CONTEXT_CUT_MARKER) - 2
+                cut_text = _cut_at_boundary(doc_text, room)
+                if cut_text:
+                    context_parts.append(f"{header}{cut_text}{CONTEXT_CUT_MARKER}\n\n")
+                    source_ids.append(doc_id)
+                break
+            context_parts.append(part)
+            source_ids.append(doc_id)
+            chars_left -= len(part)
 
-        return context_text, source_ids
+        context = ("".join(context_parts), source_ids)
+        self.context_cache.set(query_vector, context)
+        return context
 
-    async def chat_stream(self, query: str, history: List[Dict[str, Any]], user_tier: str) -> AsyncGenerator[str, None]:
+    async def chat_stream(
+        self,
+        query: str,
+        history: List[Dict[str, Any]],
+        user_tier: str,
+        capture: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[str, None]:
         """
         Generates a streaming response using Groq Cloud Inference + Qdrant Context.
+
+        Identical concurrent requests (same normalized query, tier and
+        history) are coalesced: the first one generates the answer and the
+        others wait for it and replay it, instead of repeating the
+        retrieval and the inference.
+
+        Args:
+            capture: Optional dict that receives the retrieved "context" and
+                     "sources", so the answer can be evaluated afterwards
+                     without repeating the retrieval.
         """
-        # 1. Retrieve Context
-        context_str, source_ids = self._get_context(query)
-        
-        # 2. Construct System Prompt
-        system_prompt = (
-            "Eres Justiniano, un asistente legal experto en leyes españolas (BOE). "
-            "Usa la siguiente información de contexto (referencias a documentos) para responder. "
-            "Si no puedes responder con certeza, indícalo. "
-            "Responde siempre en español profesional.\n\n"
-            "No pases de los 12000 tokens en la respuesta."
-            f"CONTEXTO DISPONIBLE:\n{context_str}"
-        )
+        # Take only the last messages that fit the history budget, to avoid
+        # overflowing tokens (or a slow prefill) and confusing the model
+        history_payload = _trim_history(history) if history else []
+        # Sources aren't known yet; the tier stands for the model (it selects it)
+        inflight_key = LLMCache.make_key(query, [], user_tier, history_payload)
+
+        # 1. Same request already being answered: wait for it and replay its answer
+        leader = self._inflight.get(inflight_key)
+        if leader is not None:
+            log.info("Identical request in flight: waiting for its answer.")
+            # shield: a disconnecting follower must not cancel the leader's future
+            result = await asyncio.shield(leader)
+            if result is not None:
+                if capture is not None:
+                    capture["context"] = result["context"]
+                    capture["sources"] = result["sources"]
+                for piece in _replay_chunks(result["answer"]):
+                    yield piece
+                return
+            # The leader failed or was aborted: answer this request on its own
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        result = {}
+        try:
+            async for piece in self._generate_stream(query, history_payload, user_tier, result):
+                yield piece
+        finally:
+            if self._inflight.get(inflight_key) is future:
+                del self._inflight[inflight_key]
+            # Followers only reuse complete answers
+            future.set_result(result if "answer" in result else None)
+            if capture is not None:
+                capture["context"] = result.get("context", "")
+                capture["sources"] = result.get("sources", [])
+
+    async def _generate_stream(
+        self,
+        query: str,
+        history_payload: List[Dict[str, Any]],
+        user_tier: str,
+        result: Dict[str, Any]
+    ) -> AsyncGenerator[str, None]:
+        """
+        Retrieves the context and streams the answer (from the response
+        cache or from Groq).
+
+        Args:
+            result: Receives the "context" and "sources" once retrieved, and
+                    the full "answer" only if it was generated completely.
+        """
+        # 1. Retrieve Context. It runs as a task, so the parts of the prompt
+        # that don't depend on it are built without waiting for it (cheap
+        # work: the gain is small, the point is nothing waits needlessly)
+        context_task = asyncio.create_task(self._get_context(query))
+
+        # 2. Select the model and build the context-independent prompt parts
         selected_model = "llama-3.3-70b-versatile" if user_tier == 'pro' else "llama-3.1-8b-instant"
-        
         log.info(f"Using model: {selected_model} for tier: {user_tier}")
-        # 3. Build Messages Payload for Groq
-        messages_payload = [{'role': 'system', 'content': system_prompt}]
-        
         # Add limited history to conserve context window
-        if history:
-            # Take only the last 4 messages to avoid overflowing tokens or confusing the model
-            messages_payload.extend(history[-4:])
+        conversation = [*history_payload, {'role': 'user', 'content': query}]
+
+        try:
+            context_str, source_ids = await context_task
+        finally:
+            # Client gone before retrieval finished: don't leave it running
+            context_task.cancel()
+        result["context"] = context_str
+        result["sources"] = source_ids
+
+        # 3. Build Messages Payload for Groq (static instructions + per-query context)
+        # The static prompt goes first, in its own message: the leading tokens
+        # are identical on every request, so Groq's prefix cache can reuse them
+        messages_payload = [
+            {'role': 'system', 'content': STATIC_SYSTEM_PROMPT},
+            {'role': 'system', 'content': f"CONTEXTO DISPONIBLE:\n{context_str}"},
+            *conversation,
+        ]
 
-        messages_payload.append({'role': 'user', 'content': query})
+        # 4. Replay a cached answer to the same question, sources and history.
+        # Answers given without sources (e.g. Qdrant down) are never cached.
+        use_cache = bool(source_ids)
+        if use_cache:
+            cache_key = LLMCache.make_key(query, source_ids, selected_model, history_payload)
+            cached_answer = self.response_cache.get(cache_key)
+            if cached_answer is not None:
+                log.info("Response cache hit: skipping Groq inference.")
+                for piece in _replay_chunks(cached_answer):
+                    yield piece
+                result["answer"] = cached_answer
+                return
 
-        # 4. Call Groq API (Streaming)
+        # 5. Call Groq API (Streaming)
         try:
-            stream = self.groq_client.chat.completions.create(
+            stream = await self.groq_client.chat.completions.create(
                 model=selected_model,
                 messages=messages_payload,
-                temperature=0.3, 
+                temperature=GENERATION_TEMPERATURE,
                 max_tokens=1024,
                 stream=True,
                 stop=None
             )
 
-            # 5. Yield chunks
-            for chunk in stream:
-                content = chunk.choices[0].delta.content
-                if content:
-                    yield content
+            # 6. Yield chunks (the loop keeps serving other requests between
+            # them). Closing the stream also ends an aborted generation.
+            parts = []
+            async with stream:
+                async for chunk in stream:
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        parts.append(content)
+                        yield content
+
+            # Only complete answers are cached or shared (not errors or aborted streams)
+            if parts:
+                answer = "".join(parts)
+                result["answer"] = answer
+                if use_cache:
+                    self.response_cache.set(cache_key, answer)
 
         except Exception as e:
             log.error(f"Groq Inference Error: {e}")
             yield f"Error del sistema: No se pudo conectar con el motor de IA. ({str(e)})"
 
+def _estimate_tokens(text: str) -> int:
+    """Approximate token count of a text (see CHARS_PER_TOKEN)."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def _trim_history(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Keeps the most recent messages (at most HISTORY_MAX_MESSAGES) whose
+    estimated tokens add up to HISTORY_TOKEN_BUDGET; older ones are dropped.
+    """
+    kept = []
+    tokens = 0
+    for message in reversed(history[-HISTORY_MAX_MESSAGES:]):
+        tokens += _estimate_tokens(str(message.get('content', '')))
+        if tokens > HISTORY_TOKEN_BUDGET:
+            break
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+def _cut_at_boundary(text: str, max_chars: int) -> str:
+    """
+    Returns the start of text, at most max_chars long, ending at a paragraph
+    or sentence end (a word end if there's none in its second half).
+    Returns "" if not even one word fits.
+    """
+    if len(text) <= max_chars:
+        return text
+    head = text[:max(max_chars, 0)]
+    for end in (head.rfind('\n'), head.rfind('. ') + 1):
+        if end >= max_chars // 2:
+            return head[:end].rstrip()
+    # +1: a word ending exactly at max_chars is kept whole
+    end = text.rfind(' ', 0, max(max_chars, 0) + 1)
+    return head[:end].rstrip() if end > 0 else ""
+
+def _replay_chunks(answer: str) -> Iterator[str]:
+    """
+    Splits an already generated answer into small chunks, so that replayed
+    answers are streamed like generated ones.
+    """
+    for i in range(0, len(answer), CACHE_REPLAY_CHUNK_CHARS):
+        yield answer[i:i + CACHE_REPLAY_CHUNK_CHARS]
+
 # Singleton instance
 rag_service = RagService()
\ No newline at end of file
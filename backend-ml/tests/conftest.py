@@ -1,9 +1,57 @@
 
 import os
+from pathlib import Path
+
+import numpy as np
 import pytest
+import pytest_asyncio
 
 # Set dummy environment variables BEFORE modules are imported
 # This prevents Groq/Qdrant clients from failing during instantiation at module level
 os.environ["GROQ_API_KEY"] = "gsk_dummy_key_for_testing_only"
 os.environ["QDRANT_HOST"] = "localhost"
 os.environ["QDRANT_API_KEY"] = "dummy_qdrant_key"
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+class FixedEncoder:
+    """Stands in for BGE-M3: every text is embedded as the same vector."""
+
+    def __init__(self, vector):
+        self.vector = vector
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return self.vector
+        return np.tile(self.vector, (len(texts), 1))
+
+@pytest.fixture(scope="session")
+def bge_m3():
+    """
+    The session's BGE-M3 stand-in (see FixedEncoder), loaded once and
+    shared by every test that needs an encoder.
+    """
+    return FixedEncoder(np.load(FIXTURES_DIR / "bge_m3_dummy.npy"))
+
+@pytest.fixture(autouse=True, scope="session")
+def _fast_encoder(session_mocker, bge_m3):
+    """
+    Replaces the BGE-M3 loader for the whole session with bge_m3, so no
+    test downloads or loads the real model (~2.3 GB, ~15 s cold start)
+    even if it reaches the embedder.
+    """
+    return session_mocker.patch("rag_agent.service.load_embedder", return_value=bge_m3)
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def http_client():
+    """
+    One pooled BOE client (the production one) shared by the live-contract
+    tests, so they reuse its connections instead of each paying a new
+    TCP + TLS handshake. Tests using it run on the session event loop.
+    """
+    # Imported here: only the network tests need the ingestion client
+    from boe_ingestion.services import api_client
+
+    client = api_client.create_client()
+    yield client
+    await client.aclose()
@@ -3,10 +3,9 @@ import httpx
 
 from boe_ingestion.services import api_client
 
-pytestmark = pytest.mark.network
-
-@pytest.mark.asyncio  # Necesario para funciones de test 'async'
-async def test_fetch_summary_ids_contract():
+@pytest.mark.network
+@pytest.mark.asyncio(loop_scope="session")  # Necesario para funciones de test 'async'
+async def test_fetch_summary_ids_contract(http_client):
     """
     Tests the contract of the live BOE summary API.
     It verifies that the API still returns the expected JSON structure
@@ -17,28 +16,80 @@ async def test_fetch_summary_ids_contract():
     test_date = "20230510"  # The date we used for our fixtures
     expected_doc_id = "BOE-A-2023-11073" # A known document from that date
 
-    async with httpx.AsyncClient() as client:
-        doc_ids = await api_client.fetch_summary_ids(client, test_date)
+    doc_ids = await api_client.fetch_summary_ids(http_client, test_date)
 
     assert isinstance(doc_ids, list)
     assert len(doc_ids) > 0
     assert expected_doc_id in doc_ids
 
-@pytest.mark.asyncio
-async def test_fetch_document_xml_contract():
+@pytest.mark.network
+@pytest.mark.asyncio(loop_scope="session")
+async def test_fetch_document_xml_contract(http_client):
     """
     Tests the contract of the live BOE XML document API.
-    It verifies that a known document ID still returns valid XML.
+    It verifies that a known document ID still returns valid XML bytes.
     
     This test requires a live internet connection.
     """
     test_doc_id = "BOE-A-2023-11073"
     
-    async with httpx.AsyncClient() as client:
-        xml_content = await api_client.fetch_document_xml(client, test_doc_id)
-        
+    xml_content = await api_client.fetch_document_xml(http_client, test_doc_id)
+
     assert xml_content is not None
-    assert isinstance(xml_content, str)
-    assert "<documento" in xml_content
-    assert test_doc_id in xml_content
-    assert "MARÍA JESÚS MONTERO CUADRADO" in xml_content
\ No newline at end of file
+    assert isinstance(xml_content, bytes)
+    assert b"<documento" in xml_content
+    assert test_doc_id.encode() in xml_content
+    assert "MARÍA JESÚS MONTERO CUADRADO".encode("utf-8") in xml_content
+
+
+SUMMARY_ITEM = {"identificador": "BOE-A-2023-11073", "url_xml": "https://www.boe.es/x"}
+SUMMARY_PAYLOAD = {"data": {"sumario": {"diario": [
+    {"seccion": [{"codigo": "1", "departamento": [{"epigrafe": [{"item": SUMMARY_ITEM}]}]}]}
+]}}}
+
+@pytest.mark.asyncio
+async def test_fetch_summary_ids_retries_5xx_and_revalidates_cache(tmp_path, mocker):
+    """
+    Tests (offline) that a transient 503 is retried, that the summary is
+    cached with its ETag, and that a re-run is served from disk on a 304.
+    """
+    mocker.patch("boe_ingestion.services.api_client.asyncio.sleep")
+    responses = [
+        httpx.Response(503),
+        httpx.Response(200, json=SUMMARY_PAYLOAD, headers={"ETag": '"v1"'}),
+        httpx.Response(304),
+    ]
+    seen_headers = []
+
+    def handler(request):
+        seen_headers.append(request.headers.get("If-None-Match"))
+        return responses.pop(0)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        first = await api_client.fetch_summary_ids(client, "20230510", cache_dir=tmp_path)
+        second = await api_client.fetch_summary_ids(client, "20230510", cache_dir=tmp_path)
+
+    assert first == second == ["BOE-A-2023-11073"]
+    assert seen_headers == [None, None, '"v1"']
+    assert (tmp_path / "20230510.etag").read_text() == '"v1"'
+
+@pytest.mark.asyncio
+async def test_connect_error_is_retried_and_not_logged_as_timeout(mocker, caplog):
+    """
+    Tests (offline, through the production aiohttp transport) that a
+    refused connection is retried and logged as a connect failure, even
+    though the transport raises it as an httpx.ConnectTimeout.
+    """
+    mocker.patch("boe_ingestion.services.api_client.asyncio.sleep")
+    # Nothing listens on port 1: the connection is refused at once
+    mocker.patch.object(api_client, "SUMARIO_URL", "http://127.0.0.1:1/sumario/{date_str}")
+
+    client = api_client.create_client()
+    try:
+        assert await api_client.fetch_summary_ids(client, "20230510") == []
+    finally:
+        await client.aclose()
+
+    retries = [r.getMessage() for r in caplog.records if "attempt" in r.getMessage()]
+    assert len(retries) == api_client.RETRY_MAX_ATTEMPTS - 1
+    assert all(message.startswith("Cannot connect to http://127.0.0.1:1/") for message in retries)
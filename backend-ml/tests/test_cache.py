@@ -0,0 +1,56 @@
+import numpy as np
+
+from rag_agent.cache import LLMCache, SemanticCache
+
+# --- Tests ---
+
+def test_cache_key_normalizes_query_and_sources():
+    """
+    Tests that case, extra whitespace and source order don't change the key,
+    while a different model or history does.
+    """
+    key = LLMCache.make_key("¿Qué es el IMV?", ["BOE-A-1", "BOE-A-2"], "llama", [])
+
+    assert LLMCache.make_key("  ¿qué es  el imv? ", ["BOE-A-2", "BOE-A-1"], "llama", []) == key
+    assert LLMCache.make_key("¿Qué es el IMV?", ["BOE-A-1", "BOE-A-2"], "gemma", []) != key
+    history = [{"role": "user", "content": "Hola"}]
+    assert LLMCache.make_key("¿Qué es el IMV?", ["BOE-A-1", "BOE-A-2"], "llama", history) != key
+
+def test_cache_evicts_least_recently_used_and_expired(mocker):
+    """
+    Tests the LRU eviction order and the time-to-live.
+    """
+    cache = LLMCache(maxsize=2, ttl=10)
+    cache.set("a", "Respuesta A")
+    cache.set("b", "Respuesta B")
+    assert cache.get("a") == "Respuesta A"  # "b" is now the least recently used
+
+    cache.set("c", "Respuesta C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "Respuesta A"
+    assert len(cache) == 2
+
+    mocker.patch("rag_agent.cache.time.monotonic", return_value=float("inf"))
+    assert cache.get("c") is None
+
+def test_semantic_cache_matches_near_duplicate_queries(mocker):
+    """
+    Tests that a similar enough embedding hits the cache, a different one
+    misses it, and that the oldest entry is overwritten when full.
+    """
+    cache = SemanticCache(maxsize=2, threshold=0.95, ttl=10)
+    ayudas = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    cache.set(ayudas, ("ctx ayudas", ["BOE-A-1"]))
+
+    near = np.array([0.99, 0.141, 0.0], dtype=np.float32)  # cos ~0.99
+    assert cache.get(near) == ("ctx ayudas", ["BOE-A-1"])
+    assert cache.get(np.array([0.0, 1.0, 0.0], dtype=np.float32)) is None
+
+    cache.set(np.array([0.0, 1.0, 0.0], dtype=np.float32), ("ctx becas", []))
+    cache.set(np.array([0.0, 0.0, 1.0], dtype=np.float32), ("ctx plazos", []))  # Overwrites "ayudas"
+    assert cache.get(ayudas) is None
+    assert len(cache) == 2
+
+    mocker.patch("rag_agent.cache.time.monotonic", return_value=float("inf"))
+    assert cache.get(np.array([0.0, 0.0, 1.0], dtype=np.float32)) is None
@@ -1,6 +1,7 @@
 import pytest
 
-from data_processing.chunker import process_document
+from data_processing import chunker
+from data_processing.chunker import process_document, _read_batches, _load_chunked_ids
 
 # --- Fixtures ---
 
@@ -80,4 +81,69 @@ def test_process_document_empty():
     should return an empty list, not crash.
     """
     assert process_document({"id": "empty", "texto_limpio": ""}) == []
-    assert process_document({"id": "no_text"}) == []
\ No newline at end of file
+    assert process_document({"id": "no_text"}) == []
+
+def test_process_document_all_boundaries():
+    """
+    Tests the finditer-based split: every boundary kind starts a new
+    chunk (case-insensitive, with non-ASCII words) and the whitespace
+    before it is not carried into either chunk.
+    """
+    doc = {
+        "id": "BOE-A-TEST-789",
+        "texto_limpio": (
+            "Preámbulo.\n"
+            "TÍTULO I. Disposiciones generales.\n"
+            "  capítulo ii. Ámbito.\n"
+            "Artículo 10. Objeto.\n"
+            "Disposición única. Derogación.\n"
+            "ANEXO\n"
+            "Tabla."
+        )
+    }
+    chunks = process_document(doc)
+
+    assert [c["text"].split("\n", 1)[0] for c in chunks] == [
+        "Preámbulo.",
+        "TÍTULO I. Disposiciones generales.",
+        "capítulo ii. Ámbito.",
+        "Artículo 10. Objeto.",
+        "Disposición única. Derogación.",
+        "ANEXO",
+    ]
+    assert chunks[-1]["text"] == "ANEXO\nTabla."
+
+def test_read_batches_skips_textless_and_duplicate_lines():
+    """
+    Tests the pre-parse filter: lines without 'texto_limpio', documents
+    chunked by a previous run and repeated IDs never reach the workers.
+    """
+    lines = [
+        b'{"id": "BOE-A-1", "texto_limpio": "Uno."}\n',
+        b'{"id": "BOE-A-2", "url": "http://example.com"}\n',
+        b'{"id": "BOE-A-3", "texto_limpio": "Tres."}\n',
+        b'{"id": "BOE-A-1", "texto_limpio": "Uno."}\n',
+        b'{"id": "BOE-A-4", "texto_limpio": "Cuatro."}\n',
+    ]
+    seen_ids = {b"BOE-A-3"}
+
+    batches = list(_read_batches(lines, 1, seen_ids))
+
+    assert batches == [[lines[0]], [lines[4]]]
+    assert seen_ids == {b"BOE-A-1", b"BOE-A-3", b"BOE-A-4"}
+
+def test_interrupted_batch_is_rolled_back(tmp_path, mocker):
+    """
+    Tests that a batch whose chunks were written but whose IDs weren't
+    fully logged is cut from both files, so re-chunking it adds no duplicates.
+    """
+    output_file = tmp_path / "knowledge_chunks.jsonl"
+    ids_file = tmp_path / "chunked_ids.txt"
+    mocker.patch.object(chunker, "OUTPUT_FILE", output_file)
+    mocker.patch.object(chunker, "CHUNKED_IDS_FILE", ids_file)
+    output_file.write_bytes(b'{"chunk_id": "BOE-A-1_chunk_0"}\n{"chunk_id": "BOE-A-2_chunk_0"}\n')
+    ids_file.write_bytes(b"BOE-A-1\n@32\nBOE-A-2\n@6")  # Crash while logging the second batch
+
+    assert _load_chunked_ids() == {b"BOE-A-1"}
+    assert output_file.read_bytes() == b'{"chunk_id": "BOE-A-1_chunk_0"}\n'
+    assert ids_file.read_bytes() == b"BOE-A-1\n@32\n"
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+import numpy as np
+import pytest
+
+from rag_agent.embedder import EmbeddingBatcher, TeiEmbedder
+
+# --- Helpers ---
+
+class FakeEmbedder:
+    """Records every encode() call; each text is embedded as [len(text)]."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([[float(len(text))] for text in texts])
+
+class FailingEmbedder:
+    """Simulates a model that crashes on encode()."""
+
+    def encode(self, texts, **kwargs):
+        raise RuntimeError("model unavailable")
+
+# --- Tests ---
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_share_one_encode_call():
+    """
+    Tests that concurrent queries are encoded in a single batch
+    and that each caller gets its own row back.
+    """
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(lambda: embedder, max_batch=8, window=0.05)
+
+    vectors = await asyncio.gather(*(batcher.encode("q" * n) for n in range(1, 4)))
+
+    assert embedder.calls == [["q", "qq", "qqq"]]
+    assert [vector.tolist() for vector in vectors] == [[1.0], [2.0], [3.0]]
+    assert all(vector.dtype == np.float32 for vector in vectors)
+
+@pytest.mark.asyncio
+async def test_encode_error_is_raised_to_every_caller():
+    """
+    Tests that a failed batch fails its callers instead of leaving them hanging.
+    """
+    batcher = EmbeddingBatcher(FailingEmbedder, window=0.01)
+
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        await batcher.encode("query")
+
+@pytest.mark.asyncio
+async def test_repeated_query_is_served_from_cache():
+    """
+    Tests that a repeated query doesn't reach the model again,
+    and that the cache keeps only the most recently used texts.
+    """
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(lambda: embedder, window=0.01, cache_size=1)
+
+    first = await batcher.encode("ayudas")
+    again = await batcher.encode("ayudas")
+    await batcher.encode("becas")  # Evicts "ayudas"
+    await batcher.encode("ayudas")
+
+    assert again is first
+    assert not again.flags.writeable
+    assert embedder.calls == [["ayudas"], ["becas"], ["ayudas"]]
+
+def test_batcher_follows_a_new_event_loop():
+    """
+    Tests that a batcher first used in one event loop keeps working
+    in the next one (its worker is rebuilt there) and stops on aclose().
+    """
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(lambda: embedder, window=0.01)
+
+    async def encode_and_close(text):
+        vector = await batcher.encode(text)
+        await batcher.aclose()
+        return vector
+
+    assert asyncio.run(batcher.encode("first")).tolist() == [5.0]
+    assert asyncio.run(encode_and_close("second")).tolist() == [6.0]
+    assert batcher._worker is None
+
+def test_tei_embedder_posts_the_batch():
+    """
+    Tests that the TEI client sends the texts in one /embed request
+    and returns float32 rows (a 1-D vector for a single text).
+    """
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        inputs = json.loads(request.content)["inputs"]
+        return httpx.Response(200, json=[[float(len(text)), 0.0] for text in inputs])
+
+    embedder = TeiEmbedder("http://tei/", client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+    vectors = embedder.encode(["a", "bb"])
+    single = embedder.encode("ccc")
+
+    assert str(requests[0].url) == "http://tei/embed"
+    assert vectors.dtype == np.float32 and vectors.tolist() == [[1.0, 0.0], [2.0, 0.0]]
+    assert single.tolist() == [3.0, 0.0]
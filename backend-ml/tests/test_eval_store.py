@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from rag_agent.eval_store import EvaluationStore
+
+# --- Tests ---
+
+@pytest.mark.asyncio
+async def test_enqueued_rows_are_written_in_one_batch(tmp_path, mocker):
+    """
+    Tests that rows queued within the write window are stored together,
+    and that rows still queued at shutdown are not lost.
+    """
+    db_path = str(tmp_path / "evaluations.db")
+    store = EvaluationStore(db_path, write_window=0.05)
+    put_many = mocker.spy(store, "put_many")
+
+    store.enqueue("msg-1", "Hola", {"faithfulness": 0.9}, "free")
+    store.enqueue("msg-2", "Adiós", {"faithfulness": 0.5}, "pro")
+    assert store.get("msg-1") is None  # Not written yet
+
+    await asyncio.sleep(0.2)
+
+    assert put_many.call_count == 1
+    assert store.get("msg-1") == {"faithfulness": 0.9}
+    assert store.get("msg-2") == {"faithfulness": 0.5}
+
+    store.enqueue("msg-3", "Otra", {"faithfulness": 0.1}, "free")
+    await store.aclose()
+
+    assert EvaluationStore(db_path).get("msg-3") == {"faithfulness": 0.1}
+
+def test_rows_queued_in_a_finished_loop_are_written_by_the_next(tmp_path):
+    """
+    Tests that the writer is rebuilt in a new event loop, carrying over
+    the rows the previous loop's writer never got to.
+    """
+    db_path = str(tmp_path / "evaluations.db")
+    store = EvaluationStore(db_path, write_window=0.05)
+
+    async def enqueue(message_id):
+        store.enqueue(message_id, "Hola", {"faithfulness": 0.9}, "free")
+
+    async def enqueue_and_close(message_id):
+        await enqueue(message_id)
+        await store.aclose()
+
+    asyncio.run(enqueue("msg-1"))  # The loop ends before the write window
+    asyncio.run(enqueue_and_close("msg-2"))
+
+    reopened = EvaluationStore(db_path)
+    assert reopened.get("msg-1") == {"faithfulness": 0.9}
+    assert reopened.get("msg-2") == {"faithfulness": 0.9}
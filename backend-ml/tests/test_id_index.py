@@ -0,0 +1,35 @@
+import pickle
+
+from boe_ingestion.services.id_index import ProcessedIdIndex
+
+# --- Tests ---
+
+def test_index_lookup_is_exact():
+    """
+    Tests that packed BOE IDs and non-conforming IDs are both found,
+    and that near-miss IDs (different series, year, padding) are not.
+    """
+    index = ProcessedIdIndex(["BOE-A-2023-11073", "BOE-B-2023-00012", "DOGC-2023-1"])
+
+    assert "BOE-A-2023-11073" in index
+    assert "BOE-B-2023-00012" in index
+    assert "DOGC-2023-1" in index
+    assert len(index) == 3
+
+    assert "BOE-B-2023-11073" not in index
+    assert "BOE-A-2022-11073" not in index
+    assert "BOE-B-2023-012" not in index  # Non-canonical padding never aliases
+    assert "DOGC-2023-2" not in index
+
+def test_index_survives_pickle_roundtrip():
+    """
+    Tests that the index can be stored in the processed IDs snapshot.
+    """
+    index = ProcessedIdIndex(["BOE-A-2023-11073"])
+    index.add("BOE-A-2024-00001")
+
+    restored = pickle.loads(pickle.dumps(index))
+
+    assert "BOE-A-2023-11073" in restored
+    assert "BOE-A-2024-00001" in restored
+    assert len(restored) == 2
@@ -13,6 +13,7 @@ focusing only on the API contract and orchestration.
 import pytest
 from fastapi.testclient import TestClient
 from main import app
+from rag_agent.eval_store import EvaluationStore
 
 # --- Helper for mocking async generators ---
 
@@ -63,6 +64,9 @@ def test_chat_endpoint_success(client, mocker):
     # Verify that the stream was correctly re-assembled into a single string
     # (TestClient automatically handles the stream consumption for assertions)
     assert response.text == "Hello, I am Justiniano."
+    # Proxies must not buffer the stream
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["x-accel-buffering"] == "no"
     
     # Verify that the service was called with the correct arguments
     mock_service.assert_called_once_with("Hello", [], "free")
@@ -70,7 +74,8 @@ def test_chat_endpoint_success(client, mocker):
 def test_chat_endpoint_validation_error(client):
     """
     Sad Path: Tests that Pydantic correctly validates missing required fields.
-    In this case, the 'query' field is missing from the body.
+    In this case, the 'query' field is missing from the body (and then an
+    unknown field is sent).
     """
     response = client.post(
         "/chat",
@@ -78,6 +83,10 @@ def test_chat_endpoint_validation_error(client):
     )
     assert response.status_code == 422 # Unprocessable Entity
 
+    # Unknown fields are rejected too
+    response = client.post("/chat", json={"query": "Hola", "user_id": "42"})
+    assert response.status_code == 422
+
 def test_chat_endpoint_tier_header(client, mocker):
     """
     Tests that the 'X-User-Tier' header is correctly extracted 
@@ -95,4 +104,66 @@ def test_chat_endpoint_tier_header(client, mocker):
     )
 
     # Verify that the service received 'pro' as the second argument
-    mock_service.assert_called_once_with("Test tier", [], "pro")
\ No newline at end of file
+    mock_service.assert_called_once_with("Test tier", [], "pro")
+
+def test_chat_endpoint_captures_answer_for_evaluation(client, mocker):
+    """
+    Tests that, with evaluation enabled, the streamed answer and its context
+    are captured and handed to the background evaluation (no re-generation).
+    """
+    async def mock_chat_generator_with_capture(query, history, user_tier, capture=None):
+        capture["context"] = "Contexto legal."
+        async for word in mock_chat_generator(query, history, user_tier):
+            yield word
+
+    mocker.patch("rag_agent.router.EVALUATION_ENABLED", True)
+    mocker.patch(
+        "rag_agent.router.rag_service.chat_stream",
+        side_effect=mock_chat_generator_with_capture
+    )
+    mock_evaluation = mocker.patch("rag_agent.router._schedule_evaluation")
+
+    response = client.post(
+        "/chat",
+        json={"query": "Hello", "message_id": "msg-1"},
+        headers={"X-User-Tier": "free"}
+    )
+
+    assert response.text == "Hello, I am Justiniano."
+    # The evaluation is scheduled once the stream is complete
+    mock_evaluation.assert_called_once()
+    message_id, query, captured, user_tier = mock_evaluation.call_args.args
+    assert (message_id, query, user_tier) == ("msg-1", "Hello", "free")
+    assert captured["text"] == "Hello, I am Justiniano."
+    assert captured["context"] == "Contexto legal."
+
+def test_get_evaluation_pending_then_ready(client, mocker, tmp_path):
+    """
+    Tests that the evaluation endpoint returns 404 while the metrics
+    are pending, and the stored metrics once they are available.
+    """
+    store = EvaluationStore(str(tmp_path / "evaluations.db"))
+    mocker.patch("rag_agent.router.evaluation_store", store)
+
+    assert client.get("/chat/evaluation/msg-1").status_code == 404
+
+    store.put("msg-1", "Hello", {"faithfulness": 0.9, "answer_relevancy": 0.8}, "free")
+    response = client.get("/chat/evaluation/msg-1")
+
+    assert response.status_code == 200
+    assert response.json()["metrics"] == {"faithfulness": 0.9, "answer_relevancy": 0.8}
+
+@pytest.mark.asyncio
+async def test_evaluation_skipped_when_backlog_is_full(mocker):
+    """
+    Tests that no evaluation task is started once EVAL_MAX_PENDING are queued.
+    """
+    from rag_agent import router as rag_router
+
+    mocker.patch("rag_agent.router.EVAL_MAX_PENDING", 0)
+    mock_evaluation = mocker.patch("rag_agent.router.run_evaluation_task", new_callable=mocker.AsyncMock)
+
+    rag_router._schedule_evaluation("msg-1", "Hello", {"text": "Hi", "context": ""}, "free")
+
+    assert not rag_router._pending_evals
+    mock_evaluation.assert_not_called()
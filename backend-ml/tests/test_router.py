@@ -81,6 +81,19 @@ def test_ingest_bad_pydantic_body(client):
     )
     assert response.status_code == 422
 
+def test_ingest_bad_date_format(client):
+    """
+    Tests the date validator: dates that are not 8 ASCII digits
+    must be rejected with 422 Unprocessable Content.
+    """
+    response = client.post(
+        "/admin/ingest-boe",
+        headers={"X-API-Key": TEST_API_KEY},
+        json={"start_date": "2023-01-01", "end_date": "20230102"}
+    )
+    assert response.status_code == 422
+    assert "must be YYYYMMDD" in response.text
+
 def test_ingest_success_and_task_called(client, mocker):
     """
     Tests the "happy path".
@@ -100,4 +113,6 @@ def test_ingest_success_and_task_called(client, mocker):
         "status": "Accepted",
         "message": "Background ingestion task started from 20230101 to 20230102."
     }
-    mock_ingest_task.assert_called_once_with("20230101", "20230102")
+    mock_ingest_task.assert_called_once_with(
+        "20230101", "20230102", client=client.app.state.http_client
+    )
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from rag_agent import service
+from rag_agent.service import _trim_history
+
+# --- Tests ---
+
+def test_history_is_trimmed_to_the_token_budget(mocker):
+    """
+    Tests that only the most recent messages fitting the budget are kept,
+    so one long pasted message drops everything older than it.
+    """
+    mocker.patch.object(service, "HISTORY_TOKEN_BUDGET", 100)
+    history = [
+        {"role": "user", "content": "Hola"},
+        {"role": "user", "content": "artículo " * 200},  # ~500 tokens
+        {"role": "assistant", "content": "Entendido."},
+        {"role": "user", "content": "¿Y los plazos?"},
+    ]
+
+    assert _trim_history(history) == history[2:]
+    assert _trim_history(history[:1]) == history[:1]
+
+@pytest.mark.asyncio
+async def test_context_is_cut_to_the_token_budget(mocker):
+    """
+    Tests that the retrieved context stops growing at the budget: the
+    first hit that doesn't fit is cut at a sentence end and marked,
+    and the less relevant ones are dropped.
+    """
+    mocker.patch.object(service, "CONTEXT_TOKEN_BUDGET", 100)
+    hits = [
+        SimpleNamespace(payload={"original_id": f"BOE-A-{i}", "text": "Artículo uno. " * 10}, score=1.0 - i / 10)
+        for i in range(3)
+    ]
+    rag = service.rag_service
+    mocker.patch.object(rag.embed_batcher, "encode", mocker.AsyncMock(return_value=np.zeros(4)))
+    mocker.patch.object(rag, "qdrant", SimpleNamespace(
+        query_points=mocker.AsyncMock(return_value=SimpleNamespace(points=hits))
+    ))
+
+    context, sources = await rag._get_context("¿Qué es el IMV?")
+
+    assert len(context) <= int(100 * service.CHARS_PER_TOKEN)
+    assert context.endswith("Artículo uno. Artículo uno." + service.CONTEXT_CUT_MARKER + "\n\n")
+    assert context.count("Artículo") < 20
+    assert sources == ["BOE-A-0", "BOE-A-1"]
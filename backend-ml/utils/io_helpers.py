@@ -1,14 +1,87 @@
 """
 Generic I/O helper functions for the application.
 """
-import json
 import logging
+import mmap
+import os
+import orjson
+from typing import BinaryIO, Iterator
 
 log = logging.getLogger(__name__)
 
+# Write buffer of JsonlWriter: one write() syscall per ~64 KiB of records
+JSONL_WRITE_BUFFER = 64 * 1024
+
+class JsonlWriter:
+    """
+    Context-managed JSONL appender for writing many records.
+
+    The file is opened once, in binary mode with a JSONL_WRITE_BUFFER
+    buffer, and records are serialized with orjson straight to UTF-8
+    bytes: N records cost N/buffer syscalls instead of N open/write/close.
+    The buffer is flushed when the block exits.
+
+    Usage:
+        with JsonlWriter(path) as writer:
+            for record in records:
+                writer.write(record)
+    """
+
+    def __init__(self, file_path: str, mode: str = 'ab'):
+        self.file_path = file_path
+        self.mode = mode
+        self._f: BinaryIO | None = None
+
+    def __enter__(self) -> "JsonlWriter":
+        self._f = open(self.file_path, self.mode, buffering=JSONL_WRITE_BUFFER)
+        return self
+
+    def write(self, data: dict):
+        """Buffers one record (one JSON line)."""
+        self._f.write(orjson.dumps(data) + b'\n')
+
+    def __exit__(self, exc_type, exc, tb):
+        self._f.close()
+        self._f = None
+
+class AppendFd:
+    """
+    Append-only (O_APPEND) file descriptor for logs that several writers
+    (concurrent ingestion tasks or processes) append to.
+
+    There is no Python-level buffer: each write() is one os.write at the
+    current end of the file, so a batch is never split across buffer
+    flushes and interleaved mid-line with another writer's batch.
+    """
+
+    def __init__(self, file_path: str):
+        self.name = file_path
+        self.fd = os.open(file_path, os.O_APPEND | os.O_WRONLY | os.O_CREAT, 0o644)
+
+    def write(self, data: bytes):
+        # A regular file takes the whole write at once; loop on the rare short write
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self) -> "AppendFd":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 def save_to_jsonl(data: dict, file_path: str, mode: str = 'a'):
     """
     Appends a single dictionary to a JSONL file.
+    (Opens the file for this one record: use JsonlWriter for many.)
 
     Args:
         data: The dictionary to save.
@@ -16,9 +89,9 @@ def save_to_jsonl(data: dict, file_path: str, mode: str = 'a'):
         mode: File mode ('a' for append, 'w' for write).
     """
     try:
-        with open(file_path, mode, encoding='utf-8') as f:
-            json_line = json.dumps(data, ensure_ascii=False)
-            f.write(json_line + '\n')
+        # orjson emits UTF-8 bytes directly (same as ensure_ascii=False)
+        with JsonlWriter(file_path, mode + 'b') as writer:
+            writer.write(data)
     except IOError as e:
         log.error(f"Failed to write to JSONL file {file_path}: {e}")
 
@@ -32,8 +105,102 @@ def save_processed_id(doc_id: str, file_path: str):
         file_path: The full path to the processed IDs file.
     """
     try:
-        # 'a' mode = append
-        with open(file_path, 'a', encoding='utf-8') as f:
-            f.write(doc_id + '\n')
+        with AppendFd(file_path) as f:
+            f.write(doc_id.encode('utf-8') + b'\n')
     except IOError as e:
-        log.error(f"Failed to write to processed_ids file {file_path}: {e}")
\ No newline at end of file
+        log.error(f"Failed to write to processed_ids file {file_path}: {e}")
+
+def write_jsonl_lines(lines: list[bytes], f: BinaryIO) -> bool:
+    """
+    Writes a batch of already serialized JSONL lines (each ending in a newline)
+    to an open JSONL file ('ab' mode) and fsyncs it once.
+
+    Long-running tasks keep the handle open for their whole duration, so
+    each batch costs a write and an fsync, not an open/close.
+
+    Args:
+        lines: The encoded lines to save, in order.
+        f: The open binary file handle.
+
+    Returns:
+        True if the batch was written (or was empty), False on I/O error.
+    """
+    if not lines:
+        return True
+    try:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+        return True
+    except IOError as e:
+        log.error(f"Failed to write batch to JSONL file {f.name}: {e}")
+        return False
+
+def write_ids_batch(doc_ids: list[str], f: AppendFd):
+    """
+    Appends a batch of document IDs to the processed IDs log in a single
+    (atomic) write, and fsyncs it once.
+
+    Args:
+        doc_ids: The IDs to save (e.g., ["BOE-A-2023-11073", ...]).
+        f: The log's open AppendFd.
+    """
+    if not doc_ids:
+        return
+    try:
+        f.write(('\n'.join(doc_ids) + '\n').encode('utf-8'))
+        os.fsync(f.fileno())
+    except IOError as e:
+        log.error(f"Failed to write batch to processed_ids file {f.name}: {e}")
+
+def iter_lines_mmap(file_path: str) -> Iterator[bytes]:
+    """
+    Iterates over the lines of a (large) file through a read-only mmap.
+
+    Line boundaries are found with mmap.find (a C memchr scan) instead of
+    going through a buffered file object. The lines are yielded as bytes,
+    without the trailing newline, ready for orjson.loads.
+
+    Args:
+        file_path: The full path to the file.
+    """
+    with open(file_path, 'rb') as f:
+        # mmap can't map an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            pos = 0
+            while pos < size:
+                end = mm.find(b'\n', pos)
+                if end == -1:
+                    end = size
+                yield mm[pos:end]
+                pos = end + 1
+
+def iter_lines_with_progress(file_path: str, desc: str, update_every: int = 1000) -> Iterator[bytes]:
+    """
+    Same as iter_lines_mmap, with a tqdm progress bar over the file size.
+
+    The bar counts bytes and is only refreshed every update_every lines,
+    so it costs nothing noticeable per line (unlike wrapping the line
+    iterator itself in tqdm).
+
+    Args:
+        file_path: The full path to the file.
+        desc: Label shown next to the progress bar.
+        update_every: Number of lines between progress bar updates.
+    """
+    # Imported here: only the offline data scripts show progress bars
+    from tqdm import tqdm
+
+    with tqdm(total=os.path.getsize(file_path), unit='B', unit_scale=True, desc=desc) as pbar:
+        pending = 0
+        for i, line in enumerate(iter_lines_mmap(file_path), 1):
+            pending += len(line) + 1  # +1: the newline stripped by iter_lines_mmap
+            yield line
+            if i % update_every == 0:
+                pbar.update(pending)
+                pending = 0
+        # The last line may have no newline: don't overshoot the total
+        pbar.update(min(pending, pbar.total - pbar.n))